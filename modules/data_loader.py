@@ -192,6 +192,15 @@ def load_main_csv(uploaded_file, STR):
     # PLATZ: String, stripped.
     # PLATZ: Строка, без пробелов.
     df["PLATZ"] = df["PLATZ"].astype(str).str.strip()
+
+    # Free-text columns are stored as Arrow-backed strings: st.dataframe sends every table
+    # to the browser as Arrow, so these columns no longer need a per-render conversion.
+    # ARTIKELNR/ZUSTAND stay categorical (fast code comparisons, str.startswith with tuples).
+    # Текстовые колонки храним как строки на базе Arrow: st.dataframe передает каждую таблицу
+    # в браузер в формате Arrow, поэтому эти колонки больше не конвертируются при каждом рендере.
+    # ARTIKELNR/ZUSTAND остаются категориальными (быстрое сравнение кодов, str.startswith с кортежами).
+    for col in ("ARTBEZ1", "LHMNR", "CHARGE1", "PLATZ"):
+        df[col] = df[col].astype("string[pyarrow]")
     
     # CREATED_BY: String, stripped.
     # CREATED_BY: Строка, без пробелов.
@@ -223,7 +232,7 @@ def load_main_csv(uploaded_file, STR):
     # This prevents displaying the last modification date as the deletion date.
     # Если паллета на складе (401), очищаем OUT_DATE и OUT_TIME.
     # Это предотвращает отображение даты последнего изменения как даты удаления.
-    mask_stock = df["ZUSTAND"] == "401"
+    mask_stock = ~df["IS_DELETED"]
     df.loc[mask_stock, "OUT_DATE"] = pd.NaT
     df.loc[mask_stock, "OUT_TIME"] = None
 
@@ -134,8 +134,10 @@ def show_main_display(filtered_df, deleted_df, STR):
 
             # Aggregate counts by pallet type.
             # Агрегируем количество по типу паллеты.
+            # The named "nunique" aggregation runs vectorized over all groups instead of a lambda per group.
+            # Именованная агрегация "nunique" выполняется векторно по всем группам вместо лямбды на группу.
             pallet_stats = deleted_df_classified.groupby("PALLET_TYPE").agg(
-                Palety=("LHMNR", lambda s: s.nunique())
+                Palety=("LHMNR", "nunique")
             ).reset_index()
 
             # Display metrics horizontally.
@@ -250,7 +252,9 @@ def show_main_display(filtered_df, deleted_df, STR):
                 as_index=False,
                 observed=True
             ).agg(
-                Deleted_Pallets=("LHMNR", lambda s: s.nunique()),
+                # Named "nunique": vectorized over all groups, no Python lambda per group.
+                # Именованная "nunique": векторно по всем группам, без Python-лямбды на группу.
+                Deleted_Pallets=("LHMNR", "nunique"),
                 Deleted_Qty=("QUANTITY", "sum")
             )
             
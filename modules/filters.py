@@ -5,7 +5,7 @@
 import streamlit as st
 from datetime import datetime, timedelta
 import pandas as pd
-from utils import load_packaging_config
+from utils import load_packaging_config, date_range_mask
 
 
 def render_analysis_filters(df: pd.DataFrame, STR):
@@ -36,7 +36,13 @@ def render_analysis_filters(df: pd.DataFrame, STR):
     # Mandant selection (narrow column).
     # Выбор манданта (узкая колонка).
     with col_mandant:
-        available_mandants = sorted(df["MANDANT"].astype(str).unique()) if not df.empty else ["351", "352"]
+        # MANDANT is categorical with sorted categories (see load_main_csv), so the options are read
+        # from the categories without casting every row to str. Categories never contain NaN, so rows
+        # with an empty MANDANT do not turn into a "nan" option that no comparison could match.
+        # MANDANT - категориальная колонка с отсортированными категориями (см. load_main_csv), поэтому
+        # варианты берутся из категорий без приведения каждой строки к str. Категории не содержат NaN,
+        # поэтому строки с пустым MANDANT не превращаются в вариант "nan", которому ничто не соответствует.
+        available_mandants = df["MANDANT"].cat.categories.tolist() if not df.empty else ["351", "352"]
         
         default_idx = 0
         if "352" in available_mandants:
@@ -127,13 +133,23 @@ def render_analysis_filters(df: pd.DataFrame, STR):
         else:
             selected_time_range = None
 
+    # MANDANT is compared once per rerun: the same mask limits the article options and starts the
+    # global filter below.
+    # MANDANT сравнивается один раз за перезапуск: та же маска ограничивает варианты артикулов и
+    # служит началом глобального фильтра ниже.
+    mask_mandant = df["MANDANT"] == selected_mandant
+
     # Article selection (multiselect).
     # Выбор артикула (мультивыбор).
     with col_artikel:
-        all_artikel_options = sorted(
-            df.loc[df["MANDANT"] == selected_mandant, "ARTIKELNR"]
-            .dropna()
-            .unique()
+        # ARTIKELNR is categorical with sorted categories (see load_main_csv), so dropping the
+        # unused ones yields the sorted options without a Python sort over strings.
+        # ARTIKELNR - категориальная колонка с отсортированными категориями (см. load_main_csv),
+        # поэтому удаление неиспользуемых дает отсортированные варианты без сортировки строк в Python.
+        all_artikel_options = (
+            df.loc[mask_mandant, "ARTIKELNR"]
+            .cat.remove_unused_categories()
+            .cat.categories
             .tolist()
         )
         selected_artikel = st.multiselect(
@@ -146,24 +162,20 @@ def render_analysis_filters(df: pd.DataFrame, STR):
     # --- Apply Filters ---
     # --- Применение фильтров ---
     
-    # Global mask for Mandant.
-    # Глобальная маска для манданта.
-    mask_global = (df["MANDANT"] == selected_mandant)
-
+    # Global mask: Mandant and date.
+    # Глобальная маска: мандант и дата.
     # Filter by date (OUT_DATE or IN_DATE).
     # Фильтр по дате (OUT_DATE или IN_DATE).
-    mask_global &= df[date_field].between(
-        pd.Timestamp(date_start),
-        pd.Timestamp(date_end),
-    )
+    # Same inclusive range check as Series.between, done on the int64 view (see date_range_mask).
+    # Та же включающая проверка диапазона, что и Series.between, на представлении int64 (см. date_range_mask).
+    mask_global = mask_mandant & date_range_mask(df[date_field], date_start, date_end)
 
     # Additional logic for Output mode: show only deleted pallets (ZUSTAND != 401).
     # Дополнительная логика для режима Выход: показывать только удаленные паллеты (ZUSTAND != 401).
+    # IS_DELETED is precomputed in load_main_csv.
+    # IS_DELETED предварительно вычисляется в load_main_csv.
     if date_field == "OUT_DATE":
-        if "IS_DELETED" in df.columns:
-            mask_global &= df["IS_DELETED"]
-        else:
-            mask_global &= df["ZUSTAND"] != "401"
+        mask_global &= df["IS_DELETED"]
 
     # Create a DataFrame without article and time filters (for comparative statistics).
     # This ensures metrics like "Articles with discrepancy" are calculated globally for the selected period.
@@ -193,8 +205,14 @@ def render_analysis_filters(df: pd.DataFrame, STR):
 
     # Apply article filter if selected (only for the main view).
     # Применяем фильтр по артикулу, если выбран (только для основного вида).
+    # ARTIKELNR is categorical, so isin maps the few selected values to category codes once and
+    # then compares integer codes. The options above are its canonical categories, so the
+    # selection is passed as is, without stripping and upper-casing it again.
+    # ARTIKELNR категориальный, поэтому isin один раз переводит выбранные значения в коды категорий
+    # и затем сравнивает целые коды. Варианты выше - его канонические категории, поэтому
+    # выбор передается как есть, без повторной обрезки и перевода в верхний регистр.
     if selected_artikel:
-        mask_view &= df["ARTIKELNR"].isin([s.strip().upper() for s in selected_artikel])
+        mask_view &= df["ARTIKELNR"].isin(selected_artikel)
 
     # Create the final filtered DataFrame for the view.
     # Создаем итоговый отфильтрованный DataFrame для отображения.
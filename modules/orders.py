@@ -8,6 +8,14 @@ import numpy as np
 import traceback
 import sys
 import re
+import string
+import itertools
+import hashlib
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+import zipfile
+import xml.etree.ElementTree as ET
+from utils import date_range_mask, date_columns_config
 
 # Initialize cache for file-based orders in session state.
 # Инициализация кэша для заказов из файлов в состоянии сессии.
@@ -25,7 +33,9 @@ if "orders_cache" not in st.session_state:
 
 # Set of known "anchor" articles used to identify the article column.
 # Набор известных "якорных" артикулов, используемых для идентификации колонки артикула.
-KNOWN_ARTS_SET = {
+# Frozen like ARTICLE_HEADER_CANDIDATES; entries are already upper-case, matching the upper-cased cells.
+# Заморожен, как ARTICLE_HEADER_CANDIDATES; записи уже в верхнем регистре, как и сравниваемые ячейки.
+KNOWN_ARTS_SET = frozenset({
     "1",
     "2",
     "21",
@@ -40,30 +50,41 @@ KNOWN_ARTS_SET = {
     "0004 MAN",
     "MH-1872",
     "8309021164",
-}
+})
 
-# List of potential headers for the article column.
-# Список возможных заголовков для колонки артикула.
-ARTICLE_HEADER_CANDIDATES = [
+# Typical "pieces per pallet" values used to recognize the PER column.
+# Типичные значения "штук на паллете", используемые для распознавания колонки PER.
+KNOWN_PER_VALUES = np.array([1, 10, 11, 20, 22, 27, 320], dtype=np.int64)
+
+# Set of potential headers for the article column.
+# Набор возможных заголовков для колонки артикула.
+ARTICLE_HEADER_CANDIDATES = frozenset({
     "NR MATERIALU",
     "NR MATERIAU",
     "MATERIALNUMMER",
     "ARTIKELNR",
     "ARTIKEL",
-]
+})
+
+# Translation table that deletes every character allowed in an article number
+# (ASCII letters, digits, dashes and spaces); anything left over means the value is not an article.
+# Таблица перевода, удаляющая все символы, допустимые в номере артикула
+# (ASCII буквы, цифры, тире и пробелы); если что-то осталось, значение не является артикулом.
+_ART_CHARS_DELETE = str.maketrans("", "", string.ascii_letters + string.digits + "- ")
+
+# Number of top rows searched for a header before the whole checked block.
+# Количество верхних строк, в которых ищется заголовок до просмотра всего проверяемого блока.
+_HEADER_QUICK_ROWS = 20
 
-def _looks_like_article(value: str) -> bool:
-    # Checks if a value resembles an article number.
-    # Проверяет, похоже ли значение на номер артикула.
+def _looks_like_article(values: pd.Series) -> pd.Series:
+    # Checks which cells resemble an article number (cells are already str and stripped).
+    # Проверяет, какие ячейки похожи на номер артикула (ячейки уже str и без пробелов).
     # Criteria: not empty, not '0', contains alphanumeric chars/dashes/spaces.
     # Критерии: не пустое, не '0', содержит буквенно-цифровые символы/тире/пробелы.
-    v = str(value).strip()
-    if not v:
-        return False
-    if v == "0":
-        return False
-    import re
-    return bool(re.match(r"^[A-Za-z0-9\- ]+$", v))
+    # str.translate is a single C pass per value, cheaper than running the regex engine.
+    # str.translate - один проход на C для каждого значения, дешевле запуска движка регулярных выражений.
+    only_allowed = values.str.translate(_ART_CHARS_DELETE) == ""
+    return only_allowed & (values != "") & (values != "0")
 
 
 def detect_order_structure(df_o):
@@ -75,77 +96,69 @@ def detect_order_structure(df_o):
     # Limit the check to the top 200 rows for performance.
     # Ограничиваем проверку первыми 200 строками для производительности.
     max_rows_to_check = min(200, df_o.shape[0])
+    n_cols = df_o.shape[1]
+
+    def scan_rows(n_rows):
+        # Returns the factorize codes of the top n_rows cells and the stripped / upper-cased distinct values.
+        # Возвращает коды factorize для ячеек первых n_rows строк и уникальные значения без пробелов / в верхнем регистре.
+        # All checked cells are flattened into one Series, so every string kernel runs once over the block
+        # instead of once per column; masks are reshaped back to (rows, columns) for scoring.
+        # Order sheets repeat a few values a lot (blanks, 'nan', common quantities), so the string checks run
+        # once per distinct value and are mapped back to the cells through the factorize codes.
+        # Все проверяемые ячейки разворачиваются в одну Series, поэтому каждое строковое ядро выполняется один раз
+        # для всего блока, а не для каждой колонки; маски затем возвращаются к форме (строки, колонки).
+        # В листах заказов немногие значения часто повторяются (пустые, 'nan', типичные количества), поэтому
+        # строковые проверки выполняются один раз на уникальное значение и переносятся на ячейки через коды factorize.
+        cells = pd.Series(df_o.iloc[:n_rows].to_numpy(dtype=object).ravel()).astype(str)
+        codes, uniques = pd.factorize(cells)
+        values = pd.Series(uniques, dtype=object).str.strip()
+        return codes.reshape(n_rows, n_cols), values, values.str.upper()
+
+    def cell_mask(value_mask, codes):
+        # Expands a per-distinct-value mask to the (rows, columns) cell grid.
+        # Разворачивает маску по уникальным значениям в сетку ячеек (строки, колонки).
+        return value_mask.to_numpy()[codes]
 
     # --- Step 1: Search for a header row using known candidates ---
     # --- Шаг 1: Поиск строки заголовка с использованием известных кандидатов ---
-    art_col_by_header = None
-    header_row_idx = None
-
-    for row_idx in range(max_rows_to_check):
-        row_vals = df_o.iloc[row_idx, :]
-        for col_idx, cell in enumerate(row_vals):
-            text = str(cell).strip().upper()
-            if text in ARTICLE_HEADER_CANDIDATES:
-                art_col_by_header = col_idx
-                header_row_idx = row_idx
-                break
-        if art_col_by_header is not None:
-            break
-
-    if art_col_by_header is not None:
-        # Header found.
-        # Заголовок найден.
-        art_col = art_col_by_header
-        data_start_row = header_row_idx + 1
-        return {
-            "art_col": art_col,
-            "data_start_row": data_start_row,
-        }
+    # Order files put their header in the first few rows, so those are searched on their own first and the
+    # full block is scanned only when they have none; a hit there is also the first hit of the full block.
+    # argwhere returns hits in row-major order, so the first one is the topmost, leftmost header cell.
+    # Файлы заказов содержат заголовок в первых строках, поэтому сначала ищем только в них, а весь блок
+    # просматриваем, лишь если там его нет; совпадение там также является первым совпадением всего блока.
+    # argwhere возвращает совпадения построчно, поэтому первое - самая верхняя и левая ячейка заголовка.
+    for n_rows in dict.fromkeys((min(_HEADER_QUICK_ROWS, max_rows_to_check), max_rows_to_check)):
+        codes, values, values_upper = scan_rows(n_rows)
+        header_hits = np.argwhere(cell_mask(values_upper.isin(ARTICLE_HEADER_CANDIDATES), codes))
+
+        if len(header_hits):
+            # Header found.
+            # Заголовок найден.
+            header_row_idx, art_col = (int(x) for x in header_hits[0])
+            data_start_row = header_row_idx + 1
+            return {
+                "art_col": art_col,
+                "data_start_row": data_start_row,
+            }
 
     # --- Step 2: Heuristic search by content (if no header found) ---
     # --- Шаг 2: Эвристический поиск по содержимому (если заголовок не найден) ---
-    best_col = None
-    best_score = -1
-    best_first_row = None
-
-    n_cols = df_o.shape[1]
-
-    for col_idx in range(n_cols):
-        col = df_o.iloc[:max_rows_to_check, col_idx]
-
-        known_hits = 0
-        article_like = 0
-        first_article_row = None
-
-        for row_idx, val in col.items():
-            v = str(val).strip()
-            if not v:
-                continue
-
-            v_upper = v.upper()
-
-            # Check for known anchor articles.
-            # Проверка на известные якорные артикулы.
-            if v_upper in KNOWN_ARTS_SET:
-                known_hits += 1
-                if first_article_row is None:
-                    first_article_row = row_idx
-
-            # Check if value looks like an article.
-            # Проверка, похоже ли значение на артикул.
-            if _looks_like_article(v):
-                article_like += 1
-                if first_article_row is None:
-                    first_article_row = row_idx
-
-        # Score the column: matches with known articles are weighted higher.
-        # Оценка колонки: совпадения с известными артикулами имеют больший вес.
-        score = known_hits * 10 + article_like
-
-        if score > best_score and article_like > 0:
-            best_score = score
-            best_col = col_idx
-            best_first_row = first_article_row
+    # Check for known anchor articles and for values that look like an article.
+    # Проверка на известные якорные артикулы и на значения, похожие на артикул.
+    # Article characters are checked before upper-casing: e.g. 'ß'.upper() is the ASCII 'SS'.
+    # Символы артикула проверяются до перевода в верхний регистр: например, 'ß'.upper() - это ASCII 'SS'.
+    known_mask = cell_mask(values_upper.isin(KNOWN_ARTS_SET), codes)
+    article_mask = cell_mask(_looks_like_article(values), codes)
+
+    known_hits = known_mask.sum(axis=0)
+    article_like = article_mask.sum(axis=0)
+
+    # Score the columns: matches with known articles are weighted higher.
+    # Only columns with article-like values qualify; argmax keeps the first best column.
+    # Оценка колонок: совпадения с известными артикулами имеют больший вес.
+    # Подходят только колонки со значениями, похожими на артикул; argmax оставляет первую лучшую колонку.
+    score = np.where(article_like > 0, known_hits * 10 + article_like, -1)
+    best_col = int(np.argmax(score)) if len(score) and score.max() >= 0 else None
 
     if best_col is None:
         # Fallback if nothing is found.
@@ -155,10 +168,10 @@ def detect_order_structure(df_o):
             "data_start_row": 2,
         }
 
-    # Column found by content analysis.
-    # Колонка найдена путем анализа содержимого.
+    # Column found by content analysis; data starts at its first known or article-like value.
+    # Колонка найдена путем анализа содержимого; данные начинаются с первого известного или похожего на артикул значения.
     art_col = best_col
-    data_start_row = best_first_row if best_first_row is not None else 2
+    data_start_row = int(np.argmax(known_mask[:, best_col] | article_mask[:, best_col]))
 
     return {
         "art_col": art_col,
@@ -168,18 +181,149 @@ def detect_order_structure(df_o):
 
 
 
+def _column_letters_to_idx(letters):
+    # Converts column letters (e.g., 'A', 'AB') to a 0-based column index; '' gives -1.
+    # Преобразует буквы колонки (например, 'A', 'AB') в индекс колонки с 0; '' дает -1.
+    col_idx = 0
+    for ch in letters:
+        if ch.isalpha():
+            col_idx = col_idx * 26 + (ord(ch.upper()) - ord("A") + 1)
+    return col_idx - 1
+
+# Lookup for every Excel column name (A..XFD), so the sheet loop does one dict lookup per cell.
+# Таблица для всех имен колонок Excel (A..XFD), чтобы цикл по листу делал один поиск в словаре на ячейку.
+_COL_LETTERS_TO_IDX = {"": -1}
+_COL_LETTERS_TO_IDX.update(
+    (letters, _column_letters_to_idx(letters))
+    for letters in (
+        "".join(combo)
+        for length in (1, 2, 3)
+        for combo in itertools.product(string.ascii_uppercase, repeat=length)
+    )
+)
+
+
 # ---------- Parsing a single order file ----------
 # ---------- Парсинг одного файла заказа ----------
 
-def parse_order_file_to_df(fobj):
+def _to_numeric_decimal_comma(col):
+    # pd.to_numeric that also accepts a decimal comma ("1,5"), with unparsable values as NaN.
+    # The comma is replaced only in values that failed the plain parse, since to_numeric never accepts a
+    # comma anyway; columns without decimal commas skip the string replacement entirely.
+    # pd.to_numeric, который также принимает десятичную запятую ("1,5"); неразборчивые значения - NaN.
+    # Запятая заменяется только в значениях, не прошедших обычный разбор, так как to_numeric запятую
+    # все равно не принимает; колонки без десятичных запятых полностью пропускают замену строк.
+    num = pd.to_numeric(col, errors="coerce")
+    failed = num.isna().to_numpy()
+    if failed.any():
+        retry = col[failed]
+        retry = retry[retry.str.contains(",", regex=False)]
+        if not retry.empty:
+            num = num.astype(np.float64)
+            num[retry.index] = pd.to_numeric(retry.str.replace(",", ".", regex=False), errors="coerce")
+    return num
+
+
+# Precompiled byte patterns for the tiny workbook.xml / workbook.xml.rels lookups.
+# Each tag is matched first and its attributes separately, so attribute order does not matter.
+# Предкомпилированные байтовые шаблоны для маленьких workbook.xml / workbook.xml.rels.
+# Сначала ищется тег, затем отдельно его атрибуты, поэтому порядок атрибутов не важен.
+_SHEET_TAG_RE = re.compile(rb"<(?:\w+:)?sheet\s[^>]*>")
+_REL_TAG_RE = re.compile(rb"<(?:\w+:)?Relationship\s[^>]*>")
+_NAME_ATTR_RE = re.compile(rb'\sname="([^"]*)"')
+_RID_ATTR_RE = re.compile(rb'\s\w+:id="([^"]*)"')
+_ID_ATTR_RE = re.compile(rb'\sId="([^"]*)"')
+_TARGET_ATTR_RE = re.compile(rb'\sTarget="([^"]*)"')
+ORDER_SHEET_NAMES = (b"OrderMasterSheet", b"Order_Master_Sheet")
+_NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_REL_ID = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+_NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+# Namespaced tags used while streaming sheet and shared-string XML, built once.
+# Теги с пространством имен для потокового чтения XML листа и общих строк, создаются один раз.
+_TAG_SI = _NS_MAIN + "si"
+_TAG_T = _NS_MAIN + "t"
+_TAG_SHEET_DATA = _NS_MAIN + "sheetData"
+_TAG_ROW = _NS_MAIN + "row"
+_TAG_C = _NS_MAIN + "c"
+_TAG_V = _NS_MAIN + "v"
+
+
+def _attr(pattern, tag):
+    m = pattern.search(tag)
+    return m.group(1) if m else None
+
+
+def _find_sheet_rel_id_xml(wb_bytes):
+    # Full XML parse; used only when the byte search finds no usable <sheet> tag.
+    # Полный разбор XML; используется только если байтовый поиск не нашел подходящий тег <sheet>.
+    sheets = ET.fromstring(wb_bytes).findall(f"{_NS_MAIN}sheets/{_NS_MAIN}sheet")
+    if not sheets:
+        raise ValueError("Brak arkuszy w pliku XLSX")
+    for sheet in sheets:
+        if sheet.attrib.get("name", "").encode() in ORDER_SHEET_NAMES:
+            return sheet.attrib.get(_NS_REL_ID)
+    # Fallback to the first sheet if specific name not found.
+    # Резервный вариант: первый лист, если конкретное имя не найдено.
+    return sheets[0].attrib.get(_NS_REL_ID)
+
+
+def _find_order_sheet_path(zf):
+    # Returns the zip path of the order sheet: 'OrderMasterSheet' / 'Order_Master_Sheet', else the first sheet.
+    # Возвращает путь листа заказов в архиве: 'OrderMasterSheet' / 'Order_Master_Sheet', иначе первый лист.
+    wb_bytes = zf.read("xl/workbook.xml")
+    sheet_id = None
+    first_id = None
+    for tag in _SHEET_TAG_RE.findall(wb_bytes):
+        r_id = _attr(_RID_ATTR_RE, tag)
+        if r_id is None:
+            continue
+        if first_id is None:
+            first_id = r_id
+        if _attr(_NAME_ATTR_RE, tag) in ORDER_SHEET_NAMES:
+            sheet_id = r_id
+            break
+    if sheet_id is None:
+        sheet_id = first_id
+    if sheet_id is None:
+        sheet_id = _find_sheet_rel_id_xml(wb_bytes)
+    else:
+        sheet_id = sheet_id.decode()
+    if sheet_id is None:
+        raise ValueError("Nie można znaleźć arkusza dla zamówień (rels).")
+
+    rels_bytes = zf.read("xl/_rels/workbook.xml.rels")
+    sheet_path = None
+    for tag in _REL_TAG_RE.findall(rels_bytes):
+        if _attr(_ID_ATTR_RE, tag) == sheet_id.encode():
+            target = _attr(_TARGET_ATTR_RE, tag)
+            if target is not None:
+                sheet_path = target.decode()
+            break
+    if sheet_path is None:
+        for rel in ET.fromstring(rels_bytes).findall(f"{_NS_PKG_REL}Relationship"):
+            if rel.attrib.get("Id") == sheet_id:
+                sheet_path = rel.attrib.get("Target")
+                break
+    if sheet_path is None:
+        raise ValueError("Nie można znaleźć arkusza dla zamówień (rels).")
+
+    # Targets are relative to xl/ unless absolute ('/xl/worksheets/...' from the package root).
+    # Пути задаются относительно xl/, кроме абсолютных ('/xl/worksheets/...' от корня пакета).
+    if sheet_path.startswith("/"):
+        return sheet_path.lstrip("/")
+    if not sheet_path.startswith("xl/"):
+        return "xl/" + sheet_path
+    return sheet_path
+
+
+def _parse_order_file(fobj):
     # Reads a single order file (XLSX/CSV) and extracts relevant columns.
     # Читает один файл заказа (XLSX/CSV) и извлекает соответствующие колонки.
+    # Returns (DataFrame, None) or (None, error message); it never calls st.*, so it can run in worker threads.
+    # Возвращает (DataFrame, None) или (None, сообщение об ошибке); не вызывает st.*, поэтому может работать в рабочих потоках.
     # Uses low-level XML parsing for XLSX to avoid 'wildcard' errors in openpyxl.
     # Использует низкоуровневый парсинг XML для XLSX, чтобы избежать ошибок 'wildcard' в openpyxl.
-    
-    import io
-    import zipfile
-    import xml.etree.ElementTree as ET
 
     name = getattr(fobj, "name", "uploaded")
     df_o = None
@@ -189,166 +333,163 @@ def parse_order_file_to_df(fobj):
     if name.lower().endswith((".csv", ".txt")):
         fobj.seek(0)
         try:
+            # The C engine reads the whole (small) file in one pass; with dtype=str there is no
+            # per-chunk type inference for low_memory to save. NA detection stays on: empty fields
+            # become NaN, which the structure detection and numeric conversion rely on.
+            # C-движок читает весь (небольшой) файл за один проход; при dtype=str нет определения типов
+            # по частям, которое экономил бы low_memory. Распознавание NA остается включенным: пустые поля
+            # становятся NaN, на что опираются определение структуры и числовое преобразование.
             df_o = pd.read_csv(
                 fobj,
                 sep=";",
                 dtype=str,
                 encoding="utf-8",
                 header=None,
+                engine="c",
+                low_memory=False,
             )
         except Exception as e:
             print("\n===== ORDER PARSE ERROR (CSV/TXT) =====", file=sys.stderr)
             traceback.print_exc()
             print("===== END ORDER PARSE ERROR =====\n", file=sys.stderr)
-            st.error(f"Błąd czytania pliku zamówienia {name}: {e}")
-            return None
+            return None, f"Błąd czytania pliku zamówienia {name}: {e}"
 
     # Handle XLSX files using direct XML parsing.
     # Обработка XLSX файлов с использованием прямого парсинга XML.
     else:
         try:
+            # The uploaded file is already a seekable in-memory buffer, so the ZIP is read from it
+            # directly instead of copying all bytes into a second BytesIO. ZipFile leaves it open.
+            # Загруженный файл уже является буфером в памяти с поддержкой seek, поэтому ZIP читается
+            # прямо из него, без копирования всех байтов во второй BytesIO. ZipFile не закрывает его.
             fobj.seek(0)
-            file_bytes = fobj.read()
-            fobj.seek(0)
-
-            with zipfile.ZipFile(io.BytesIO(file_bytes), "r") as zf:
-                # Find the 'OrderMasterSheet' in workbook.xml.
-                # Находим 'OrderMasterSheet' в workbook.xml.
-                with zf.open("xl/workbook.xml") as wb:
-                    wb_tree = ET.parse(wb)
-                    wb_root = wb_tree.getroot()
-                ns = {"ns": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
-
-                sheet_id = None
-                for sheet in wb_root.findall("ns:sheets/ns:sheet", ns):
-                    sheet_name = sheet.attrib.get("name", "")
-                    r_id = sheet.attrib.get("{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id")
-                    if sheet_name in ("OrderMasterSheet", "Order_Master_Sheet"):
-                        sheet_id = r_id
-                        break
-                if sheet_id is None:
-                    # Fallback to the first sheet if specific name not found.
-                    # Резервный вариант: первый лист, если конкретное имя не найдено.
-                    first_sheet = wb_root.find("ns:sheets/ns:sheet", ns)
-                    if first_sheet is None:
-                        raise ValueError("Brak arkuszy w pliku XLSX")
-                    sheet_id = first_sheet.attrib.get(
-                        "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
-                    )
 
-                # Find the path to the sheet file in workbook.xml.rels.
-                # Находим путь к файлу листа в workbook.xml.rels.
-                with zf.open("xl/_rels/workbook.xml.rels") as rels:
-                    rels_tree = ET.parse(rels)
-                    rels_root = rels_tree.getroot()
-                rel_ns = {"rel": "http://schemas.openxmlformats.org/package/2006/relationships"}
-
-                sheet_path = None
-                for rel in rels_root.findall("rel:Relationship", rel_ns):
-                    if rel.attrib.get("Id") == sheet_id:
-                        sheet_path = rel.attrib.get("Target")
-                        break
-                if sheet_path is None:
-                    raise ValueError("Nie można znaleźć arkusza dla zamówień (rels).")
-
-                if not sheet_path.startswith("xl/"):
-                    sheet_path = "xl/" + sheet_path
-
-                # Parse the sheet XML.
-                # Парсим XML листа.
-                with zf.open(sheet_path) as sf:
-                    sheet_tree = ET.parse(sf)
-                    sheet_root = sheet_tree.getroot()
+            with zipfile.ZipFile(fobj, "r") as zf:
+                # Find the 'OrderMasterSheet' in workbook.xml and its file via workbook.xml.rels.
+                # Находим 'OrderMasterSheet' в workbook.xml и его файл через workbook.xml.rels.
+                sheet_path = _find_order_sheet_path(zf)
 
                 # Load shared strings (text values).
                 # Загружаем общие строки (текстовые значения).
+                # Read with iterparse; each processed <si> is detached from the <sst> root, so neither the
+                # whole DOM nor a growing list of emptied elements is kept.
+                # Читаем через iterparse; каждый обработанный <si> отсоединяется от корня <sst>, поэтому
+                # не хранится ни весь DOM, ни растущий список очищенных элементов.
                 shared_strings = []
                 if "xl/sharedStrings.xml" in zf.namelist():
                     with zf.open("xl/sharedStrings.xml") as ssf:
-                        ss_tree = ET.parse(ssf)
-                        ss_root = ss_tree.getroot()
-                    for si in ss_root.findall("{http://schemas.openxmlformats.org/spreadsheetml/2006/main}si"):
-                        t = si.find("{http://schemas.openxmlformats.org/spreadsheetml/2006/main}t")
-                        shared_strings.append(t.text if t is not None else "")
-
-                # Extract rows and cells.
-                # Извлекаем строки и ячейки.
+                        sst_root = None
+                        for event, si in ET.iterparse(ssf, events=("start", "end")):
+                            if event == "start":
+                                if sst_root is None:
+                                    sst_root = si
+                                continue
+                            if si.tag != _TAG_SI:
+                                continue
+                            # findtext looks up <t> and reads its text in one C call ("" when it is empty, None when missing).
+                            # Interned so repeated texts (article codes, headers) share one object across files.
+                            # findtext находит <t> и читает его текст одним вызовом на C ("" если пусто, None если отсутствует).
+                            # Интернируем, чтобы повторяющиеся тексты (коды артикулов, заголовки) делили один объект между файлами.
+                            shared_strings.append(sys.intern(si.findtext(_TAG_T) or ""))
+                            sst_root.clear()
+
+                # Extract rows and cells, streaming the sheet XML row by row.
+                # Извлекаем строки и ячейки, читая XML листа потоково, строка за строкой.
                 rows_data = []
-                for row_elem in sheet_root.findall(
-                    ".//{http://schemas.openxmlformats.org/spreadsheetml/2006/main}row"
-                ):
-                    row_values = []
-                    last_col_idx = -1
-                    for cell in row_elem.findall(
-                        "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}c"
-                    ):
-                        # Determine column index from cell reference (e.g., 'A1').
-                        # Определяем индекс колонки из ссылки на ячейку (например, 'A1').
-                        cell_ref = cell.attrib.get("r", "")
-                        col_letters = "".join(ch for ch in cell_ref if ch.isalpha())
-                        col_idx = 0
-                        for ch in col_letters:
-                            col_idx = col_idx * 26 + (ord(ch.upper()) - ord("A") + 1)
-                        col_idx -= 1  # 0-based
-
-                        # Fill gaps for empty cells.
-                        # Заполняем пропуски для пустых ячеек.
-                        while last_col_idx + 1 < col_idx:
-                            row_values.append("")
-                            last_col_idx += 1
-
-                        # Get cell value.
-                        # Получаем значение ячейки.
-                        v = cell.find(
-                            "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}v"
-                        )
-                        cell_type = cell.attrib.get("t")
-                        if v is not None and v.text is not None:
-                            if cell_type == "s":
+                with zf.open(sheet_path) as sf:
+                    sheet_data = None
+                    for event, row_elem in ET.iterparse(sf, events=("start", "end")):
+                        if event == "start":
+                            if row_elem.tag == _TAG_SHEET_DATA:
+                                sheet_data = row_elem
+                            continue
+                        if row_elem.tag != _TAG_ROW:
+                            continue
+                        row_values = []
+                        last_col_idx = -1
+                        # Iterating the children directly avoids compiling a findall path per row.
+                        # Прямой перебор дочерних элементов избегает разбора пути findall для каждой строки.
+                        for cell in row_elem:
+                            if cell.tag != _TAG_C:
+                                continue
+                            # Determine column index from cell reference (e.g., 'A1').
+                            # The reference is optional; a cell without one takes the next column.
+                            # Определяем индекс колонки из ссылки на ячейку (например, 'A1').
+                            # Ссылка необязательна; ячейка без нее занимает следующую колонку.
+                            cell_ref = cell.get("r")
+                            if cell_ref:
+                                col_letters = cell_ref.rstrip("0123456789")
+                                col_idx = _COL_LETTERS_TO_IDX.get(col_letters)
+                                if col_idx is None:
+                                    col_idx = _column_letters_to_idx(col_letters)
+
+                                # Fill gaps for empty cells in one step.
+                                # Заполняем пропуски для пустых ячеек за один шаг.
+                                gap = col_idx - last_col_idx - 1
+                                if gap > 0:
+                                    row_values.extend([""] * gap)
+                            else:
+                                col_idx = last_col_idx + 1
+
+                            # Get cell value.
+                            # Получаем значение ячейки.
+                            # A missing or empty <v> both give an empty cell.
+                            # Отсутствующий или пустой <v> дает пустую ячейку.
+                            value = cell.findtext(_TAG_V) or ""
+                            if value and cell.get("t") == "s":
                                 # Shared string lookup.
                                 # Поиск в общих строках.
-                                idx = int(v.text)
+                                idx = int(value)
                                 value = shared_strings[idx] if 0 <= idx < len(shared_strings) else ""
-                            else:
-                                value = v.text
-                        else:
-                            value = ""
-
-                        row_values.append(str(value))
-                        last_col_idx = col_idx
 
-                    if row_values:
-                        rows_data.append(row_values)
+                            row_values.append(value)
+                            last_col_idx = col_idx
+
+                        if row_values:
+                            rows_data.append(row_values)
+                        # Free the processed row; cells are not needed once copied into row_values.
+                        # Detaching it from <sheetData> also keeps the parent from collecting emptied rows.
+                        # Освобождаем обработанную строку; ячейки не нужны после копирования в row_values.
+                        # Отсоединение от <sheetData> также не дает родителю накапливать пустые строки.
+                        if sheet_data is not None:
+                            sheet_data.clear()
+                        else:
+                            row_elem.clear()
 
                 if not rows_data:
                     raise ValueError("Brak danych w arkuszu zamówień.")
 
                 # Create DataFrame from extracted data.
+                # Short rows (trailing empty cells are not stored in XLSX) are padded with "" in place, so the
+                # constructor gets a rectangular block and no fillna pass over every column is needed.
                 # Создаем DataFrame из извлеченных данных.
-                max_cols = max(len(r) for r in rows_data)
-                rows_padded = [r + [""] * (max_cols - len(r)) for r in rows_data]
-                df_o = pd.DataFrame(rows_padded)
+                # Короткие строки (пустые ячейки в конце не хранятся в XLSX) дополняются "" на месте, поэтому
+                # конструктор получает прямоугольный блок и не нужен проход fillna по всем колонкам.
+                n_cols = max(map(len, rows_data))
+                for row_values in rows_data:
+                    if len(row_values) < n_cols:
+                        row_values.extend([""] * (n_cols - len(row_values)))
+                df_o = pd.DataFrame(rows_data)
+            fobj.seek(0)
 
         except Exception as e:
             print("\n===== ORDER PARSE ERROR (XLSX ZIP/XML) =====", file=sys.stderr)
             traceback.print_exc()
             print("===== END ORDER PARSE ERROR =====\n", file=sys.stderr)
-            st.error(f"Błąd czytania pliku zamówienia {name}: {e}")
-            return None
+            return None, f"Błąd czytania pliku zamówienia {name}: {e}"
 
     # --- Determine data structure ---
     # --- Определение структуры данных ---
     if df_o.shape[1] < 1:
-        st.error(f"Plik {name} ma za mało kolumn (oczekiwane >= 1).")
-        return None
+        return None, f"Plik {name} ma za mało kolumn (oczekiwane >= 1)."
 
     structure = detect_order_structure(df_o)
     art_col = structure["art_col"]
     data_start_row = structure["data_start_row"]
 
-    # Slice the DataFrame to get the data section.
-    # Срезаем DataFrame, чтобы получить секцию данных.
-    df_data = df_o.iloc[data_start_row:, :].copy()
+    # Slice the DataFrame to get the data section (read-only below, so no copy).
+    # Срезаем DataFrame, чтобы получить секцию данных (ниже только чтение, поэтому без копии).
+    df_data = df_o.iloc[data_start_row:, :]
 
     # Extract the article column.
     # Извлекаем колонку артикула.
@@ -359,36 +500,43 @@ def parse_order_file_to_df(fobj):
     right_cols_indices = []
     max_right_span = 5
 
-    for offset in range(1, max_right_span + 1):
+    # Only the scanned window right of the article column is converted to text.
+    # В текст конвертируется только просматриваемое окно справа от колонки артикула.
+    scan_window = df_data.iloc[:, art_col + 1:art_col + 1 + max_right_span].astype(str)
+
+    # Numeric version of each scanned column, converted once and reused by every step below.
+    # Числовая версия каждой просмотренной колонки, конвертируется один раз и используется всеми шагами ниже.
+    num_cols = {}
+
+    for offset in range(1, scan_window.shape[1] + 1):
         idx = art_col + offset
-        if idx >= df_data.shape[1]:
-            break
 
-        col_raw = df_data.iloc[:, idx].astype(str)
         # Attempt to convert to numeric.
         # Попытка конвертировать в число.
-        col_num = pd.to_numeric(col_raw.str.replace(",", "."), errors="coerce")
-        non_null = col_num.dropna()
+        col_num = _to_numeric_decimal_comma(scan_window.iloc[:, offset - 1])
+        num_cols[idx] = col_num
 
-        # Keep column if it has at least one numeric value.
-        # Оставляем колонку, если в ней есть хотя бы одно числовое значение.
-        if len(non_null) < 1:
+        # Keep column if it has at least one numeric value (checked without building a dropna copy).
+        # Оставляем колонку, если в ней есть хотя бы одно числовое значение (без создания копии через dropna).
+        if not col_num.notna().any():
             continue
 
         right_cols_indices.append(idx)
 
     if not right_cols_indices:
-        st.error(f"Plik {name}: brak liczbowych kolumn z ilościami po kolumnie artykułu.")
-        return None
+        return None, f"Plik {name}: brak liczbowych kolumn z ilościami po kolumnie artykułu."
 
     # --- Heuristic Column Classification ---
     # --- Эвристическая классификация колонок ---
     # Try to identify Pallets, Qty, and Per (pieces per pallet) columns.
     # Пытаемся идентифицировать колонки Паллеты, Кол-во и Per (штук на паллете).
     
-    right_part = df_data.iloc[:, right_cols_indices].copy()
-
-    KNOWN_PER_VALUES = {10, 20, 11, 1, 22, 320, 27}
+    # Numeric right-hand columns as one float matrix (one column per entry of right_cols_indices).
+    # Every kept column has at least one number, so the nan-aware reductions below are well defined.
+    # Числовые колонки справа как одна матрица float (по колонке на каждый элемент right_cols_indices).
+    # В каждой оставленной колонке есть хотя бы одно число, поэтому nan-редукции ниже определены.
+    right_mat = np.column_stack([num_cols[idx].to_numpy(dtype=np.float64) for idx in right_cols_indices])
+    right_pos = {idx: pos for pos, idx in enumerate(right_cols_indices)}
 
     pallets_col_idx = None
     per_col_idx = None
@@ -396,28 +544,26 @@ def parse_order_file_to_df(fobj):
     
     # Gather statistics for each column to aid classification.
     # Собираем статистику для каждой колонки, чтобы помочь в классификации.
-    col_stats = {}
-    for idx in right_cols_indices:
-        raw = df_data.iloc[:, idx].astype(str).str.replace(",", ".")
-        col = pd.to_numeric(raw, errors="coerce")
+    col_max = np.nanmax(right_mat, axis=0)
+    col_min = np.nanmin(right_mat, axis=0)
+    zero_share = (right_mat == 0).mean(axis=0)
+    # Number of distinct known PER values among the integer parts of each column (same truncation as int()).
+    # Comparing the truncated matrix with each known value covers all columns at once, without a sort per column;
+    # NaN never equals a known value, so missing cells drop out.
+    # Количество различных известных значений PER среди целых частей каждой колонки (то же усечение, что и int()).
+    # Сравнение усеченной матрицы с каждым известным значением охватывает все колонки сразу, без сортировки на колонку;
+    # NaN никогда не равен известному значению, поэтому пустые ячейки выпадают.
+    per_hits = (np.trunc(right_mat)[:, :, None] == KNOWN_PER_VALUES).any(axis=0).sum(axis=1)
 
-        non_null = col.dropna()
-        if non_null.empty:
-            continue
-
-        max_val = non_null.max()
-        min_val = non_null.min()
-        unique_vals = set(int(v) for v in non_null.unique() if pd.notna(v))
-
-        per_hits = unique_vals.intersection(KNOWN_PER_VALUES)
-        zero_share = (col == 0).sum() / len(col)
+    col_stats = {}
+    for pos, idx in enumerate(right_cols_indices):
+        per_hits_count = int(per_hits[pos])
 
         col_stats[idx] = {
-            "max": max_val,
-            "min": min_val,
-            "unique": unique_vals,
-            "per_hits_count": len(per_hits),
-            "zero_share": zero_share,
+            "max": col_max[pos],
+            "min": col_min[pos],
+            "per_hits_count": per_hits_count,
+            "zero_share": zero_share[pos],
         }
 
     # 1. Identify PER column (matches known values).
@@ -453,14 +599,10 @@ def parse_order_file_to_df(fobj):
     # Pallets count should generally be smaller than Quantity.
     # Количество паллет обычно должно быть меньше количества штук.
     if pallets_col_idx is not None and qty_col_idx is not None:
-        p_vals = pd.to_numeric(
-            df_data.iloc[:, pallets_col_idx].astype(str).str.replace(",", "."),
-            errors="coerce"
-        ).fillna(0)
-        q_vals = pd.to_numeric(
-            df_data.iloc[:, qty_col_idx].astype(str).str.replace(",", "."),
-            errors="coerce"
-        ).fillna(0)
+        # NaN compares as False, so missing values drop out of the check like zeros did.
+        # NaN при сравнении дает False, поэтому пустые значения выпадают из проверки, как и нули.
+        p_vals = right_mat[:, right_pos[pallets_col_idx]]
+        q_vals = right_mat[:, right_pos[qty_col_idx]]
 
         mask_check = (p_vals > 0) & (q_vals > 0)
         if mask_check.any():
@@ -477,117 +619,114 @@ def parse_order_file_to_df(fobj):
     # Резервный вариант для колонки PER, если не идентифицирована.
     if per_col_idx is None and len(right_cols_indices) >= 2:
         candidate = right_cols_indices[-1]
-        col = pd.to_numeric(
-            df_data.iloc[:, candidate].astype(str).str.replace(",", "."),
-            errors="coerce",
-        )
-        if col.dropna().max() <= 1000:
+        if col_max[right_pos[candidate]] <= 1000:
             per_col_idx = candidate
 
     # --- Construct Result DataFrame ---
     # --- Создание итогового DataFrame ---
-    data = pd.DataFrame()
-    data["ARTIKELNR_RAW"] = artikel_col
-
-    if qty_col_idx is not None:
-        data["QTY_RAW"] = df_data.iloc[:, qty_col_idx]
-    else:
-        data["QTY_RAW"] = ""
+    # Columns that were not identified count as zero.
+    # Неидентифицированные колонки считаются нулевыми.
+    # Rows are selected before fillna, so only the kept rows are filled.
+    # Строки выбираются до fillna, поэтому заполняются только оставшиеся строки.
+    zeros = pd.Series(0.0, index=df_data.index)
 
-    if pallets_col_idx is not None:
-        data["PALLETS_RAW"] = df_data.iloc[:, pallets_col_idx]
-    else:
-        data["PALLETS_RAW"] = ""
+    def numeric_or_zero(idx, rows=slice(None)):
+        return num_cols[idx][rows].fillna(0) if idx is not None else zeros[rows]
 
-    if per_col_idx is not None:
-        data["PER_RAW"] = df_data.iloc[:, per_col_idx]
-    else:
-        data["PER_RAW"] = ""
+    # Rows without pallets are dropped first, so only the remaining articles are normalized.
+    # Строки без паллет отбрасываются сначала, поэтому нормализуются только оставшиеся артикулы.
+    pallets = numeric_or_zero(pallets_col_idx).astype(int)
+    has_pallets = (pallets > 0).to_numpy()
 
     # Normalize and clean data.
     # Нормализация и очистка данных.
-    res = pd.DataFrame()
-    res["ARTIKELNR"] = data["ARTIKELNR_RAW"].astype(str).str.strip().str.upper()
-
-    res["ORDER_QTY"] = pd.to_numeric(
-        data["QTY_RAW"].astype(str).str.replace(",", "."),
-        errors="coerce",
-    ).fillna(0)
-
-    res["ORDER_PALLETS"] = pd.to_numeric(
-        data["PALLETS_RAW"].astype(str).str.replace(",", "."),
-        errors="coerce",
-    ).fillna(0).astype(int)
-
-    # Filter out rows with no pallets.
-    # Отфильтровываем строки без паллет.
-    res = res[res["ORDER_PALLETS"] > 0].copy()
+    # ARTIKELNR is canonical (stripped, upper-cased) from here on, like in load_main_csv and the manual
+    # orders, so downstream code compares it as is instead of normalizing it again.
+    # С этого места ARTIKELNR канонический (обрезан, в верхнем регистре), как в load_main_csv и ручных
+    # заказах, поэтому дальнейший код сравнивает его как есть, без повторной нормализации.
+    arts = artikel_col[has_pallets].str.strip().str.upper()
+    has_art = (arts != "").to_numpy()
+    keep = has_pallets.copy()
+    keep[has_pallets] = has_art
+
+    arts = arts[has_art]
+    pallets = pallets[keep]
+    qty = numeric_or_zero(qty_col_idx, keep)
 
     # Calculate QTY if missing but PER and PALLETS are present.
     # Вычисляем QTY, если отсутствует, но есть PER и PALLETS.
-    per_vals = pd.to_numeric(
-        data["PER_RAW"].astype(str).str.replace(",", "."),
-        errors="coerce",
-    ).fillna(0)
-
-    missing = (res["ORDER_QTY"] == 0) & (per_vals > 0)
-    if missing.any():
-        res.loc[missing, "ORDER_QTY"] = (
-            res.loc[missing, "ORDER_PALLETS"] * per_vals.loc[missing]
-        )
+    per_vals = numeric_or_zero(per_col_idx, keep)
+    qty = qty.mask((qty == 0) & (per_vals > 0), pallets * per_vals)
 
-    res["ARTIKELNR"] = res["ARTIKELNR"].astype(str).str.strip()
-    res = res[res["ARTIKELNR"] != ""].copy()
+    # The result is assembled once from the filtered columns instead of being filtered and copied twice.
+    # Результат собирается один раз из отфильтрованных колонок, вместо двух фильтраций с копированием.
+    res = pd.DataFrame({"ARTIKELNR": arts, "ORDER_QTY": qty, "ORDER_PALLETS": pallets})
 
-    return res
+    return res, None
 
 # ---------- Aggregation of multiple order files ----------
 # ---------- Агрегация нескольких файлов заказов ----------
 
-def natural_sort_key(text):
-    # Helper for natural sorting (e.g., 1, 2, 10 instead of 1, 10, 2).
-    # Помощник для естественной сортировки (например, 1, 2, 10 вместо 1, 10, 2).
-    import re
-    parts = re.split(r"(\d+)", str(text).upper())
-    return [int(p) if p.isdigit() else p for p in parts]
+# Precompiled patterns for natural sorting and for dates in file names.
+# Предкомпилированные шаблоны для естественной сортировки и для дат в именах файлов.
+_NAT_RE = re.compile(r"(\d+)")
+_DMY_RE = re.compile(r"(\d{2})[-._](\d{2})[-._](\d{4})")
+_YMD_RE = re.compile(r"(\d{4})[-._](\d{2})[-._](\d{2})")
+_DMY_SHORT_RE = re.compile(r"(\d{2})[-._](\d{2})[-._](\d{2})")
+
+def _pad_number(match):
+    # Encodes a digit run as a NUL marker plus a fixed-width number.
+    # Кодирует последовательность цифр как маркер NUL плюс число фиксированной ширины.
+    return f"\x00{int(match.group(0)):020d}"
+
+def natural_sort_keys(values):
+    # Vectorized natural sort key (e.g., 1, 2, 10 instead of 1, 10, 2) for a Series of strings.
+    # Векторизованный ключ естественной сортировки (например, 1, 2, 10 вместо 1, 10, 2) для Series строк.
+    # Digit runs become fixed-width numbers, so plain string order equals natural order; the NUL
+    # marker sorts below every character, like a shorter text part does in a list comparison.
+    # Последовательности цифр становятся числами фиксированной ширины, поэтому обычный строковый порядок
+    # равен естественному; маркер NUL меньше любого символа, как более короткая текстовая часть при сравнении списков.
+    return values.astype(str).str.upper().str.replace(_NAT_RE, _pad_number, regex=True)
+
+# Patterns tried in order: positions of (year, month, day) in each match and the century added to the year.
+# Шаблоны проверяются по порядку: позиции (год, месяц, день) в совпадении и век, добавляемый к году.
+_FILENAME_DATE_PATTERNS = (
+    (_DMY_RE, (2, 1, 0), 0),           # dd-mm-yyyy
+    (_YMD_RE, (0, 1, 2), 0),           # yyyy-mm-dd
+    (_DMY_SHORT_RE, (2, 1, 0), 2000),  # dd-mm-yy (assumes 20xx / предполагается 20xx)
+)
 
 def extract_date_from_filename(filename):
     # Attempts to extract a date from the filename.
     # Пытается извлечь дату из имени файла.
     # Supports formats: dd-mm-yyyy, yyyy-mm-dd, dd-mm-yy.
     # Поддерживает форматы: dd-mm-yyyy, yyyy-mm-dd, dd-mm-yy.
+    # datetime.date validates the parts directly, without building a pandas Timestamp per candidate.
+    # datetime.date проверяет части напрямую, без создания Timestamp pandas для каждого кандидата.
     s = str(filename)
-    
-    # 1. Format dd-mm-yyyy
-    match_dmy = re.search(r"(\d{2})[-._](\d{2})[-._](\d{4})", s)
-    if match_dmy:
-        d, m, y = match_dmy.groups()
-        try:
-            return pd.Timestamp(year=int(y), month=int(m), day=int(d)).date()
-        except ValueError:
-            pass
-
-    # 2. Format yyyy-mm-dd
-    match_ymd = re.search(r"(\d{4})[-._](\d{2})[-._](\d{2})", s)
-    if match_ymd:
-        y, m, d = match_ymd.groups()
-        try:
-            return pd.Timestamp(year=int(y), month=int(m), day=int(d)).date()
-        except ValueError:
-            pass
-
-    # 3. Format dd-mm-yy (assumes 20xx)
-    match_dmy_short = re.search(r"(\d{2})[-._](\d{2})[-._](\d{2})", s)
-    if match_dmy_short:
-        d, m, y = match_dmy_short.groups()
-        year_full = 2000 + int(y)
+    for pattern, (yi, mi, di), century in _FILENAME_DATE_PATTERNS:
+        match = pattern.search(s)
+        if not match:
+            continue
+        parts = match.groups()
         try:
-            return pd.Timestamp(year=year_full, month=int(m), day=int(d)).date()
+            return date(century + int(parts[yi]), int(parts[mi]), int(parts[di]))
         except ValueError:
-            pass
-            
+            continue
     return None
 
+def _order_file_key(f):
+    # Identifies an uploaded file by its content: size plus a hash of all its bytes.
+    # Идентифицирует загруженный файл по содержимому: размер плюс хеш всех его байтов.
+    # The name is left out, so the same file uploaded twice (e.g. 'zam.xlsx' and 'zam (1).xlsx') is parsed once.
+    # The uploaded file is an in-memory buffer, so the hash reads it through getbuffer() without a copy;
+    # this only runs when the set of uploaded files changes.
+    # Имя не учитывается, поэтому один и тот же файл, загруженный дважды (например, 'zam.xlsx' и 'zam (1).xlsx'), разбирается один раз.
+    # Загруженный файл - буфер в памяти, поэтому хеш читает его через getbuffer() без копирования;
+    # это выполняется только при изменении набора загруженных файлов.
+    with f.getbuffer() as buf:
+        return (buf.nbytes, hashlib.blake2b(buf, digest_size=16).hexdigest())
+
 def aggregate_uploaded_orders(uploaded_orders):
     # Processes uploaded order files and aggregates them.
     # Обрабатывает загруженные файлы заказов и агрегирует их.
@@ -604,13 +743,23 @@ def aggregate_uploaded_orders(uploaded_orders):
             "orders_all": None,
             "orders_agg": None,
             "orders_detail_map": {},
+            "files_sources_count": None,
             "valid_count": 0,
         }
+        st.session_state["order_file_cache"] = {}
+        st.session_state["order_file_key_cache"] = {}
         return None, None, 0
 
     # Generate a key to check if files have changed.
     # Генерируем ключ для проверки, изменились ли файлы.
-    files_keys = tuple((getattr(f, "name", ""), getattr(f, "size", None)) for f in uploaded_orders)
+    # The uploader's file_id changes on every upload, so re-uploading a different file with the same
+    # name and size is not mistaken for the cached one, while plain reruns still skip all hashing.
+    # file_id загрузчика меняется при каждой загрузке, поэтому повторно загруженный другой файл с тем же
+    # именем и размером не принимается за кешированный, а обычные перезапуски по-прежнему обходятся без хеширования.
+    files_keys = tuple(
+        (getattr(f, "name", ""), getattr(f, "size", None), getattr(f, "file_id", None))
+        for f in uploaded_orders
+    )
 
     cache = st.session_state.get("orders_cache", {})
     if (
@@ -627,37 +776,93 @@ def aggregate_uploaded_orders(uploaded_orders):
     # Process files.
     # Обработка файлов.
     orders_list = []
-
+    part_names = []
+
+    # Parsed files are cached one by one, so adding or removing a file does not re-parse the others.
+    # Only successful parses are stored; a broken file is parsed again and reports its error each time.
+    # Разобранные файлы кешируются по отдельности, поэтому добавление или удаление файла не вызывает повторный разбор остальных.
+    # Сохраняются только успешные результаты; поврежденный файл разбирается заново и каждый раз сообщает об ошибке.
+    file_cache = st.session_state.setdefault("order_file_cache", {})
+    used_keys = set()
+
+    # Content keys are remembered per uploader file_id (new for every upload), so adding one file hashes
+    # only that file instead of every file in the set again.
+    # Ключи содержимого запоминаются по file_id загрузчика (новый при каждой загрузке), поэтому при добавлении
+    # одного файла хешируется только он, а не снова все файлы набора.
+    key_cache = st.session_state.setdefault("order_file_key_cache", {})
+    file_keys = []
     for f in uploaded_orders:
+        file_id = getattr(f, "file_id", None)
+        key = key_cache.get(file_id) if file_id is not None else None
+        if key is None:
+            key = _order_file_key(f)
+            if file_id is not None:
+                key_cache[file_id] = key
+        file_keys.append(key)
+    used_keys.update(file_keys)
+
+    # Forget keys of files that are no longer uploaded.
+    # Забываем ключи файлов, которые больше не загружены.
+    current_ids = {getattr(f, "file_id", None) for f in uploaded_orders}
+    for stale_id in set(key_cache) - current_ids:
+        del key_cache[stale_id]
+
+    # Files missing from the cache are parsed in parallel: they share no state until the concat below.
+    # Errors are only collected in the workers and shown afterwards, since st.* must run on the script thread.
+    # Файлы, отсутствующие в кеше, разбираются параллельно: до объединения ниже у них нет общего состояния.
+    # Ошибки в потоках только собираются и показываются после, так как st.* должен вызываться в потоке скрипта.
+    # Files with identical content share one key, so each distinct file is parsed only once.
+    # Файлы с одинаковым содержимым имеют один ключ, поэтому каждый уникальный файл разбирается только один раз.
+    to_parse = {}
+    for f, key in zip(uploaded_orders, file_keys):
+        if key not in file_cache:
+            to_parse.setdefault(key, f)
+    # A single new file (the usual case when adding one more upload) is parsed inline, without starting a pool.
+    # Один новый файл (обычный случай при добавлении еще одной загрузки) разбирается напрямую, без запуска пула.
+    parse_results = {}
+    if len(to_parse) == 1:
+        parse_results = {key: _parse_order_file(f) for key, f in to_parse.items()}
+    elif to_parse:
+        with ThreadPoolExecutor(max_workers=min(8, len(to_parse))) as executor:
+            parse_results = dict(zip(to_parse, executor.map(_parse_order_file, to_parse.values())))
+
+    for f, file_key in zip(uploaded_orders, file_keys):
         name = getattr(f, "name", "uploaded")
-        parsed = parse_order_file_to_df(f)
+        parsed = file_cache.get(file_key)
         if parsed is None:
-            continue
+            # A broken file reports its error once, even if it was uploaded several times.
+            # Поврежденный файл сообщает об ошибке один раз, даже если был загружен несколько раз.
+            parsed, error = parse_results.pop(file_key, (None, None))
+            if parsed is None:
+                if error:
+                    st.error(error)
+                continue
+            file_cache[file_key] = parsed
         
         if parsed.empty:
             st.warning(f"Plik {name}: nie znaleziono zamówień (pusty wynik).")
             continue
 
-        # Add metadata.
-        # Добавляем метаданные.
-        parsed = parsed.copy()
+        # Add metadata. A shallow copy is enough: it shares the parsed column data, and the new
+        # columns are added only to the copy, so the cached per-file frame stays unchanged.
+        # Добавляем метаданные. Достаточно поверхностной копии: она разделяет данные колонок,
+        # а новые колонки добавляются только в копию, поэтому кешированный DataFrame файла не меняется.
+        parsed = parsed.copy(deep=False)
         parsed["SOURCE_FILE"] = name
-        parsed["ORDER_DATE"] = extract_date_from_filename(name)
-
-        # Build detail map for tooltips.
-        # Строим карту деталей для подсказок.
-        grouped = parsed.groupby("ARTIKELNR", as_index=False).agg(
-            ORDER_PALLETS=("ORDER_PALLETS", "sum"),
-            ORDER_QTY=("ORDER_QTY", "sum"),
-        )
-        for _, row in grouped.iterrows():
-            art = str(row["ARTIKELNR"]).strip().upper()
-            qty = float(row["ORDER_QTY"])
-            if art not in orders_detail_map:
-                orders_detail_map[art] = {}
-            orders_detail_map[art][name] = orders_detail_map[art].get(name, 0) + qty
+        # Stored as datetime64 (NaT when the name has no date), so the daily comparison groups and merges
+        # on int64 values instead of Python date objects.
+        # Хранится как datetime64 (NaT, если в имени нет даты), поэтому ежедневное сравнение группирует
+        # и объединяет по значениям int64, а не по объектам Python date.
+        order_date = extract_date_from_filename(name)
+        parsed["ORDER_DATE"] = np.datetime64(order_date if order_date is not None else "NaT", "ns")
 
         orders_list.append(parsed)
+        part_names.append(name)
+
+    # Drop cached files that are no longer uploaded.
+    # Удаляем из кеша файлы, которые больше не загружены.
+    for stale_key in set(file_cache) - used_keys:
+        del file_cache[stale_key]
 
     if not orders_list:
         st.session_state["orders_cache"] = {
@@ -665,29 +870,87 @@ def aggregate_uploaded_orders(uploaded_orders):
             "orders_all": None,
             "orders_agg": None,
             "orders_detail_map": {},
+            "files_sources_count": None,
             "valid_count": 0,
         }
         return None, None, 0
 
     # Combine all orders.
     # Объединяем все заказы.
-    orders_all = pd.concat(orders_list, ignore_index=True)
+    # All parts share the same columns, so skip column sorting and any extra defensive copy.
+    # Все части имеют одинаковые колонки, поэтому пропускаем сортировку колонок и лишнее защитное копирование.
+    orders_all = pd.concat(orders_list, ignore_index=True, sort=False, copy=False)
+
+    # Articles are factorized once and both groupbys below run on the integer codes, instead of each
+    # hashing every article string again. Codes follow first appearance, like groupby(sort=False).
+    # ARTIKELNR stays an object column in the results, since they are merged with other frames later.
+    # Артикулы факторизуются один раз, и оба groupby ниже работают по целым кодам, вместо повторного
+    # хеширования всех строк артикулов в каждом. Коды идут в порядке первого появления, как groupby(sort=False).
+    # ARTIKELNR остается колонкой object в результатах, так как они позже объединяются с другими DataFrame.
+    art_codes, art_values = pd.factorize(orders_all["ARTIKELNR"])
+    art_values = np.asarray(art_values, dtype=object)
+
+    # Build detail map for tooltips: {article: {file name: qty}}.
+    # Строим карту деталей для подсказок: {артикул: {имя файла: количество}}.
+    # Only ORDER_QTY is shown in tooltips. One groupby over all files replaces a groupby per file; without
+    # key sorting the pairs keep their first-appearance order, i.e. files in upload order for each article.
+    # В подсказках показывается только ORDER_QTY. Один groupby по всем файлам заменяет groupby на каждый файл;
+    # без сортировки ключей пары сохраняют порядок первого появления, т.е. файлы в порядке загрузки для каждого артикула.
+    # The file name is constant within each concatenated part, so its codes are repeated per part instead of
+    # hashing SOURCE_FILE row by row; (article, file) is then one int64 key for a single-key groupby.
+    # Files uploaded under the same name share a code, so their quantities are summed like before.
+    # Имя файла постоянно в каждой объединенной части, поэтому его коды повторяются по частям вместо
+    # построчного хеширования SOURCE_FILE; пара (артикул, файл) затем - один ключ int64 для groupby по одному ключу.
+    # Файлы с одинаковым именем получают один код, поэтому их количества суммируются, как и раньше.
+    part_file_codes, file_names = pd.factorize(np.asarray(part_names, dtype=object))
+    file_names = np.asarray(file_names, dtype=object)
+    n_files = len(file_names)
+    file_codes = np.repeat(part_file_codes, [len(part) for part in orders_list])
+    pair_codes = art_codes.astype(np.int64) * n_files + file_codes
+
+    detail_qty = orders_all["ORDER_QTY"].groupby(pair_codes, sort=False).sum().astype(float)
+    pair_index = detail_qty.index.to_numpy()
+    pair_arts = pair_index // n_files
+    for art, fname, qty in zip(art_values[pair_arts], file_names[pair_index % n_files], detail_qty):
+        orders_detail_map.setdefault(art, {})[fname] = qty
+
+    # Number of files with a non-zero quantity per article (SOURCES_CNT in the orders table).
+    # Количество файлов с ненулевым количеством на артикул (SOURCES_CNT в таблице заказов).
+    # Kept per article code here and aligned with the rows of orders_agg below.
+    # Хранится по коду артикула и ниже выравнивается по строкам orders_agg.
+    sources_count = (detail_qty != 0).groupby(pair_arts, sort=False).sum()
+    files_per_code = np.zeros(len(art_values), dtype=np.int64)
+    files_per_code[sources_count.index.to_numpy()] = sources_count.to_numpy()
 
     # Aggregate by article.
     # Агрегируем по артикулу.
-    orders_agg = orders_all.groupby("ARTIKELNR", as_index=False).agg(
-        ORDER_PALLETS=("ORDER_PALLETS", "sum"),
-        ORDER_QTY=("ORDER_QTY", "sum"),
-    )
+    # No key sort here: the result is natural-sorted right below.
+    # Без сортировки ключей: результат ниже сортируется естественной сортировкой.
+    sums = orders_all[["ORDER_PALLETS", "ORDER_QTY"]].groupby(art_codes, sort=False).sum()
+    agg_codes = sums.index.to_numpy()
+    agg_pallets = sums["ORDER_PALLETS"].to_numpy()
+    agg_qty = sums["ORDER_QTY"].to_numpy()
 
     # Filter out zero pallets.
     # Отфильтровываем нулевые паллеты.
-    orders_agg = orders_agg[orders_agg["ORDER_PALLETS"] > 0].copy()
+    # Only the positions of the kept rows are selected here; the frame itself is built once below.
+    # Здесь выбираются только позиции оставшихся строк; сам DataFrame строится один раз ниже.
+    kept = np.flatnonzero(agg_pallets > 0)
 
     # Sort.
     # Сортировка.
-    orders_agg["_sort_key"] = orders_agg["ARTIKELNR"].apply(natural_sort_key)
-    orders_agg = orders_agg.sort_values("_sort_key").drop(columns=["_sort_key"]).reset_index(drop=True)
+    # The key array is argsorted directly and the filter and the sort are combined into one position
+    # array, so every column is gathered once instead of being copied by a mask and then by a take.
+    # Массив ключей сортируется через argsort, а фильтр и сортировка объединяются в один массив позиций,
+    # поэтому каждая колонка выбирается один раз, а не копируется маской и затем через take.
+    kept_arts = art_values[agg_codes[kept]]
+    order = kept[np.argsort(natural_sort_keys(pd.Series(kept_arts, dtype=object)).to_numpy(), kind="stable")]
+    agg_codes = agg_codes[order]
+    orders_agg = pd.DataFrame({
+        "ARTIKELNR": art_values[agg_codes],
+        "ORDER_PALLETS": agg_pallets[order],
+        "ORDER_QTY": agg_qty[order],
+    })
 
     valid_count = len(orders_list)
 
@@ -698,50 +961,178 @@ def aggregate_uploaded_orders(uploaded_orders):
         "orders_all": orders_all,
         "orders_agg": orders_agg,
         "orders_detail_map": orders_detail_map,
+        # Number of files with a non-zero quantity for each row of orders_agg (SOURCES_CNT in the orders table).
+        # Количество файлов с ненулевым количеством для каждой строки orders_agg (SOURCES_CNT в таблице заказов).
+        "files_sources_count": files_per_code[agg_codes],
         "valid_count": valid_count,
     }
 
     return orders_all, orders_agg, valid_count
 
-def make_order_tooltip(art, orders_detail_map, manual_agg, STR):
+def make_order_tooltip(art, orders_detail_map, manual_qty_map, STR):
     # Generates a tooltip string showing the source of orders for an article.
     # Генерирует строку подсказки, показывающую источник заказов для артикула.
+    # manual_qty_map is a plain {article: qty} dict, so no DataFrame filtering per article.
+    # manual_qty_map - обычный словарь {артикул: количество}, поэтому без фильтрации DataFrame на каждый артикул.
+    # art is a canonical ARTIKELNR (see _parse_order_file).
+    # art - канонический ARTIKELNR (см. _parse_order_file).
     lines = []
-    a = str(art).strip().upper()
 
-    if a in orders_detail_map:
-        for fname, qty in orders_detail_map[a].items():
+    if art in orders_detail_map:
+        for fname, qty in orders_detail_map[art].items():
             if qty != 0:
                 lines.append(f"{fname} - {int(qty)} szt.")
 
-    if manual_agg is not None and not manual_agg.empty:
-        man_row = manual_agg[manual_agg["ARTIKELNR"] == a]
-        if not man_row.empty:
-            mq = float(man_row["Manual_Qty"].iloc[0])
-            if mq != 0:
-                lines.append(f"{STR['manual_orders']} - {int(mq)}")
+    mq = float(manual_qty_map.get(art, 0))
+    if mq != 0:
+        lines.append(f"{STR['manual_orders']} - {int(mq)}")
 
     if not lines:
         return STR.get("tooltip_no_info", "No info")
 
     return " ; ".join(lines)
 
+def excluded_articles_mask(arts, excluded_exact, excluded_prefixes):
+    # Boolean mask of excluded articles: exact matches or matching prefixes.
+    # Булева маска исключенных артикулов: точные совпадения или совпадающие префиксы.
+    # excluded_exact is a frozenset and excluded_prefixes a tuple, both already upper-cased.
+    # excluded_exact - frozenset, excluded_prefixes - tuple, оба уже в верхнем регистре.
+    # arts holds canonical ARTIKELNR values (see _parse_order_file), so they are not normalized again.
+    # arts содержит канонические значения ARTIKELNR (см. _parse_order_file), поэтому повторно не нормализуются.
+    if not excluded_exact and not excluded_prefixes:
+        # Nothing is excluded (the usual case), so no string matching at all.
+        # Ничего не исключено (обычный случай), поэтому сравнение строк не выполняется.
+        return np.zeros(len(arts), dtype=bool)
+    if isinstance(arts.dtype, pd.CategoricalDtype):
+        # Categorical articles are matched once per category and mapped back through the codes;
+        # a missing value (code -1) picks the appended last entry, the result for its 'nan' text.
+        # Категориальные артикулы сравниваются один раз на категорию и переносятся через коды;
+        # пропуск (код -1) берет добавленный последний элемент - результат для его текста 'nan'.
+        per_category = excluded_articles_mask(
+            pd.Series(arts.cat.categories.astype(str).append(pd.Index(["nan"]))), excluded_exact, excluded_prefixes
+        )
+        return per_category[arts.cat.codes.to_numpy()]
+    arts = arts.astype(str)
+    mask = arts.isin(excluded_exact)
+    if excluded_prefixes:
+        mask |= arts.str.startswith(excluded_prefixes)
+    return mask.to_numpy(dtype=bool)
+
+def diff_messages(diff, positive_template, negative_template, zero_message):
+    # Vectorized message per difference: positive_template / negative_template filled with {val}=|diff|,
+    # zero_message for no difference. Templates are split into prefix and suffix once, so only the
+    # numbers are converted per row.
+    # Векторизованное сообщение для каждой разницы: positive_template / negative_template с {val}=|diff|,
+    # zero_message при отсутствии разницы. Шаблоны один раз делятся на префикс и суффикс, поэтому
+    # для каждой строки преобразуются только числа.
+    pos_before, _, pos_after = positive_template.format(val="\0").partition("\0")
+    neg_before, _, neg_after = negative_template.format(val="\0").partition("\0")
+    diff = diff.to_numpy()
+    positive = diff > 0
+    negative = diff < 0
+    values = np.abs(diff).astype(np.int64).astype(str).astype(object)
+    before = np.select([positive, negative], [pos_before, neg_before], default=zero_message).astype(object)
+    after = np.select([positive, negative], [pos_after, neg_after], default="").astype(object)
+    return before + np.where(positive | negative, values, "") + after
+
+def aggregate_pallets(df, keys, pallets_name, qty_name, sort=True):
+    # Count distinct pallets (LHMNR) and sum QUANTITY per group in a single groupby pass.
+    # Подсчет уникальных паллет (LHMNR) и суммы QUANTITY по группам за один проход groupby.
+    # observed=True keeps categorical keys (ARTIKELNR) from expanding to all categories.
+    # observed=True не дает категориальным ключам (ARTIKELNR) разворачиваться во все категории.
+    # sort=False is only for callers that fully re-sort the result on its keys afterwards.
+    # sort=False - только для вызовов, которые затем полностью пересортировывают результат по его ключам.
+    return df.groupby(keys, as_index=False, sort=sort, observed=True).agg(
+        **{pallets_name: ("LHMNR", "nunique"), qty_name: ("QUANTITY", "sum")}
+    )
 
+@st.cache_data(show_spinner=False)
+def aggregate_deletions(deleted_pallets):
+    # Deleted pallets (distinct LHMNR) and quantity per article, cached across reruns with the same deletions.
+    # Удаленные паллеты (уникальные LHMNR) и количество по артикулу, кешируется между перезапусками с теми же удалениями.
+    return aggregate_pallets(deleted_pallets, "ARTIKELNR", "Deleted_Pallets", "Deleted_Qty")
+
+@st.cache_data(show_spinner=False)
+def aggregate_daily_deletions(deleted_pallets):
+    # Deleted pallets per article and normalized OUT_DATE (columns DATE, DEL), cached like aggregate_deletions.
+    # Удаленные паллеты по артикулу и нормализованной OUT_DATE (колонки DATE, DEL), кешируется как aggregate_deletions.
+    return (
+        deleted_pallets.groupby(
+            [deleted_pallets["ARTIKELNR"], deleted_pallets["OUT_DATE"].dt.normalize().rename("DATE")],
+            sort=False,
+            observed=True,
+        )["LHMNR"]
+        .nunique()
+        .reset_index(name="DEL")
+    )
 
 # ---------- Manual Orders – quick add without table ----------
 # ---------- Ручные заказы – быстрое добавление без таблицы ----------
 
+# Column types of the manual orders DataFrame. Rows are typed when added, so readers skip any coercion.
+# Типы колонок DataFrame ручных заказов. Строки типизируются при добавлении, поэтому при чтении приведение не нужно.
+MANUAL_ORDERS_SCHEMA = {"ARTIKELNR": "object", "ORDER_PALLETS": "int64", "ORDER_QTY": "int64"}
+
+def empty_manual_orders_df():
+    # Returns an empty manual orders DataFrame with the committed schema.
+    # Возвращает пустой DataFrame ручных заказов с подтвержденной схемой.
+    return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in MANUAL_ORDERS_SCHEMA.items()})
+
 def init_manual_orders():
     # Initializes session state for manual orders.
     # Инициализирует состояние сессии для ручных заказов.
-    if "manual_orders_editor_df" not in st.session_state:
-        st.session_state.manual_orders_editor_df = pd.DataFrame(
-            {"ARTIKELNR": [""], "ORDER_PALLETS": [0], "ORDER_QTY": [0]}
-        )
-    if "manual_orders_committed_df" not in st.session_state:
-        st.session_state.manual_orders_committed_df = pd.DataFrame(
-            {"ARTIKELNR": [], "ORDER_PALLETS": [], "ORDER_QTY": []}
-        )
+    # Committed orders are kept as a list of row dicts: adding a row is a plain append instead of a
+    # pd.concat over the whole frame. The DataFrame is built lazily by get_manual_orders_df().
+    # Подтвержденные заказы хранятся как список словарей-строк: добавление строки - простой append вместо
+    # pd.concat по всему DataFrame. DataFrame строится лениво в get_manual_orders_df().
+    if "manual_orders_committed_list" not in st.session_state:
+        st.session_state.manual_orders_committed_list = []
+        st.session_state.manual_orders_committed_df = None
+
+def _set_manual_orders(rows):
+    # Replaces the committed rows and drops the materialized DataFrame.
+    # Заменяет подтвержденные строки и сбрасывает построенный DataFrame.
+    st.session_state.manual_orders_committed_list = rows
+    st.session_state.manual_orders_committed_df = None
+    st.session_state.pop("manual_orders_committed_agg", None)
+
+def _append_manual_order(art, pallets, qty):
+    # Adds one committed manual order row.
+    # Добавляет одну подтвержденную строку ручного заказа.
+    st.session_state.manual_orders_committed_list.append(
+        {"ARTIKELNR": art, "ORDER_PALLETS": int(pallets), "ORDER_QTY": int(qty)}
+    )
+    st.session_state.manual_orders_committed_df = None
+    st.session_state.pop("manual_orders_committed_agg", None)
+
+def get_manual_orders_df():
+    # Returns committed manual orders as a typed DataFrame, built once per change of the rows.
+    # Возвращает подтвержденные ручные заказы как типизированный DataFrame, строится один раз на изменение строк.
+    df = st.session_state.get("manual_orders_committed_df")
+    if df is None:
+        rows = st.session_state.get("manual_orders_committed_list", [])
+        if rows:
+            df = pd.DataFrame(rows, columns=list(MANUAL_ORDERS_SCHEMA)).astype(MANUAL_ORDERS_SCHEMA)
+        else:
+            df = empty_manual_orders_df()
+        st.session_state.manual_orders_committed_df = df
+    return df
+
+def get_manual_orders_agg():
+    # Returns manual orders summed per article (None when there are none), built once per change of the rows.
+    # Возвращает ручные заказы, суммированные по артикулу (None, если их нет), строится один раз на изменение строк.
+    if "manual_orders_committed_agg" not in st.session_state:
+        manual_df = get_manual_orders_df()
+        manual_agg = None
+        if not manual_df.empty:
+            # manual_df already follows MANUAL_ORDERS_SCHEMA, so it is grouped directly.
+            # manual_df уже соответствует MANUAL_ORDERS_SCHEMA, поэтому группируется напрямую.
+            manual_agg = manual_df.groupby("ARTIKELNR", as_index=False).agg(
+                Manual_Pallets=("ORDER_PALLETS", "sum"),
+                Manual_Qty=("ORDER_QTY", "sum"),
+            )
+        st.session_state.manual_orders_committed_agg = manual_agg
+    return st.session_state.manual_orders_committed_agg
 
 def render_manual_orders_editor(artikel_options, STR):
     # Renders the interface for adding manual orders.
@@ -799,26 +1190,19 @@ def render_manual_orders_editor(artikel_options, STR):
         else:
             art_norm = new_art.strip().upper()
 
-            if art_norm not in [a.strip().upper() for a in artikel_options]:
+            # The options are canonical ARTIKELNR categories (see render_analysis_filters), so the
+            # single lookup scans them as is instead of normalizing every option into a new set.
+            # Варианты - канонические категории ARTIKELNR (см. render_analysis_filters), поэтому
+            # единственная проверка просматривает их как есть, без нормализации каждого варианта в новое множество.
+            if art_norm not in artikel_options:
                 st.warning(STR["manual_article_not_in_filter_warning"])
 
             if int(new_pallets) == 0 and int(new_qty) == 0:
                 st.warning(STR["manual_quantity_warning"])
             else:
-                # Add to committed DataFrame.
-                # Добавляем в подтвержденный DataFrame.
-                new_row = pd.DataFrame(
-                    {
-                        "ARTIKELNR": [art_norm],
-                        "ORDER_PALLETS": [int(new_pallets)],
-                        "ORDER_QTY": [int(new_qty)],
-                    }
-                )
-
-                st.session_state.manual_orders_committed_df = pd.concat(
-                    [st.session_state.manual_orders_committed_df, new_row],
-                    ignore_index=True,
-                )
+                # Add to committed orders.
+                # Добавляем в подтвержденные заказы.
+                _append_manual_order(art_norm, new_pallets, new_qty)
 
                 st.success(STR["manual_added_success"].format(art=art_norm))
 
@@ -828,30 +1212,19 @@ def render_manual_orders_editor(artikel_options, STR):
     # --- Clear All Button ---
     # --- Кнопка очистить все ---
     if st.button(STR["manual_clear_all"], type="secondary", key="clear_manual_committed"):
-        st.session_state.manual_orders_committed_df = pd.DataFrame(
-            {"ARTIKELNR": [], "ORDER_PALLETS": [], "ORDER_QTY": []}
-        )
+        _set_manual_orders([])
         st.success(STR["manual_cleared_success"])
 
     # --- Display Committed Orders ---
     # --- Отображение подтвержденных заказов ---
     st.markdown(f"#### {STR['manual_added_header']}")
 
-    committed = st.session_state.manual_orders_committed_df
+    committed = get_manual_orders_df()
 
     if not committed.empty:
-        committed_display = committed.copy()
-        committed_display["ARTIKELNR"] = committed_display["ARTIKELNR"].astype(str).str.strip().str.upper()
-        committed_display["ORDER_PALLETS"] = pd.to_numeric(
-            committed_display["ORDER_PALLETS"], errors="coerce"
-        ).fillna(0).astype(int)
-        committed_display["ORDER_QTY"] = pd.to_numeric(
-            committed_display["ORDER_QTY"], errors="coerce"
-        ).fillna(0)
-
-        # Add checkbox column for deletion.
-        # Добавляем колонку с чекбоксом для удаления.
-        committed_display["USUN"] = False
+        # Rows are already normalized and typed on add; only the checkbox column for deletion is added.
+        # Строки уже нормализованы и типизированы при добавлении; добавляется только колонка с чекбоксом для удаления.
+        committed_display = committed.assign(USUN=False)
 
         edited = st.data_editor(
             committed_display,
@@ -876,10 +1249,10 @@ def render_manual_orders_editor(artikel_options, STR):
                 indices_to_remove = [int(k) for k, v in edited_rows.items() if v.get("USUN") is True]
                 
                 if indices_to_remove:
-                    df = st.session_state.manual_orders_committed_df
-                    valid_indices = [i for i in indices_to_remove if i in df.index]
+                    rows = st.session_state.manual_orders_committed_list
+                    valid_indices = {i for i in indices_to_remove if 0 <= i < len(rows)}
                     if valid_indices:
-                        st.session_state.manual_orders_committed_df = df.drop(valid_indices).reset_index(drop=True)
+                        _set_manual_orders([r for i, r in enumerate(rows) if i not in valid_indices])
                         st.session_state["manual_order_msg"] = STR["manual_deleted_success"]
             
             st.button(STR["manual_delete_selected"], key="manual_delete_selected_committed", on_click=delete_selected_callback)
@@ -888,6 +1261,119 @@ def render_manual_orders_editor(artikel_options, STR):
 
 
 
+def build_orders_view(orders_agg_base, manual_agg, cache, STR):
+    # Combines file and manual orders per article with totals, source counts and tooltips.
+    # Объединяет заказы из файлов и ручные заказы по артикулу с итогами, числом источников и подсказками.
+    if orders_agg_base is not None:
+        orders_agg = orders_agg_base
+    else:
+        # Typed like the file aggregate, so the numeric normalization below needs no to_numeric.
+        # Типизирован как агрегат файлов, поэтому нормализации чисел ниже не нужен to_numeric.
+        orders_agg = pd.DataFrame({
+            "ARTIKELNR": pd.Series(dtype=object),
+            "ORDER_PALLETS": pd.Series(dtype="int64"),
+            "ORDER_QTY": pd.Series(dtype="float64"),
+        })
+
+    # The manual sums are placed into plain arrays by position, so the cached orders_agg_base is never
+    # modified, and no index union, reindex or fillna runs over all file rows when a manual order changes.
+    # Ручные суммы раскладываются по позициям в обычные массивы, поэтому кешированный orders_agg_base не
+    # изменяется, а при изменении ручного заказа не выполняются объединение индексов, reindex и fillna по всем строкам.
+    if manual_agg is not None and not manual_agg.empty:
+        # The article index of the file aggregate is kept in orders_cache (replaced with the files), so
+        # its hash table is built once and each manual change only looks up the few manual articles.
+        # Индекс артикулов агрегата файлов хранится в orders_cache (заменяется вместе с файлами), поэтому
+        # его хеш-таблица строится один раз, а каждое изменение ручных заказов ищет только ручные артикулы.
+        art_index = cache.get("orders_art_index")
+        if art_index is None or cache.get("orders_art_index_base") is not orders_agg_base:
+            art_index = pd.Index(orders_agg["ARTIKELNR"])
+            cache["orders_art_index"] = art_index
+            cache["orders_art_index_base"] = orders_agg_base
+
+        # Both sides have one row per article: matched manual sums go to their file row, new manual
+        # articles are appended after the file rows in their own order, as the outer join did.
+        # Обе стороны содержат по одной строке на артикул: найденные ручные суммы попадают в строку файла,
+        # новые ручные артикулы добавляются после строк файлов в своем порядке, как при внешнем объединении.
+        pos = art_index.get_indexer(manual_agg["ARTIKELNR"])
+        is_new = pos < 0
+        n_base = len(orders_agg)
+        n_new = int(is_new.sum())
+        pos[is_new] = n_base + np.arange(n_new)
+
+        manual_pallets = np.zeros(n_base + n_new, dtype=np.int64)
+        manual_qty = np.zeros(n_base + n_new, dtype=np.float64)
+        manual_pallets[pos] = manual_agg["Manual_Pallets"].to_numpy()
+        manual_qty[pos] = manual_agg["Manual_Qty"].to_numpy()
+
+        orders_agg = pd.DataFrame({
+            "ARTIKELNR": np.concatenate(
+                [orders_agg["ARTIKELNR"].to_numpy(dtype=object), manual_agg["ARTIKELNR"].to_numpy(dtype=object)[is_new]]
+            ),
+            "ORDER_PALLETS": np.concatenate(
+                [orders_agg["ORDER_PALLETS"].to_numpy(dtype=np.int64), np.zeros(n_new, dtype=np.int64)]
+            ),
+            "ORDER_QTY": np.concatenate(
+                [orders_agg["ORDER_QTY"].to_numpy(dtype=np.float64), np.zeros(n_new, dtype=np.float64)]
+            ),
+            "Manual_Pallets": manual_pallets,
+            "Manual_Qty": manual_qty,
+        })
+    else:
+        orders_agg = orders_agg.assign(Manual_Pallets=0, Manual_Qty=0)
+
+    orders_agg["Ordered_Pallets_Total"] = orders_agg["ORDER_PALLETS"] + orders_agg["Manual_Pallets"]
+    orders_agg["Ordered_Qty_Total"] = orders_agg["ORDER_QTY"] + orders_agg["Manual_Qty"]
+
+    # Calculate sources count.
+    # Подсчет количества источников.
+    orders_detail_map = cache.get("orders_detail_map", {})
+
+    # Per-row file counts are precomputed in aggregate_uploaded_orders, aligned with orders_agg_base.
+    # The join above keeps the base rows first and in order (manual-only articles follow), so the counts
+    # are placed by position instead of hashing every article through a dict map.
+    # Количество файлов по строкам предварительно вычисляется в aggregate_uploaded_orders, по строкам orders_agg_base.
+    # Объединение выше сохраняет строки базы первыми и по порядку (ручные артикулы идут следом), поэтому
+    # количества размещаются по позиции, без хеширования каждого артикула через map по словарю.
+    files_src = np.zeros(len(orders_agg), dtype=np.int64)
+    base_counts = cache.get("files_sources_count")
+    if orders_agg_base is not None and base_counts is not None and len(base_counts) == len(orders_agg_base):
+        files_src[:len(base_counts)] = base_counts
+    orders_agg["SOURCES_CNT"] = files_src + (orders_agg["Manual_Qty"] > 0).to_numpy(dtype=np.int64)
+
+    # Build each tooltip once per article.
+    # Строим каждую подсказку один раз на артикул.
+    manual_qty_map = {} if manual_agg is None else dict(zip(manual_agg["ARTIKELNR"], manual_agg["Manual_Qty"]))
+
+    # Tooltips are kept in orders_cache, which is replaced whenever the uploaded files change.
+    # They are keyed by (article, manual quantity), so editing one manual order rebuilds only that
+    # article's tooltip; entries for articles no longer shown are dropped on each rerun.
+    # Подсказки хранятся в orders_cache, который заменяется при каждом изменении загруженных файлов.
+    # Ключ - (артикул, ручное количество), поэтому изменение одного ручного заказа перестраивает только
+    # подсказку этого артикула; записи для больше не показываемых артикулов удаляются при каждом перезапуске.
+    tooltips_key = (STR["manual_orders"], STR.get("tooltip_no_info"))
+    if cache.get("tooltips_key") != tooltips_key:
+        cache["tooltips_key"] = tooltips_key
+        cache["tooltips"] = {}
+    # Both joined sides have one row per article, so every row is a distinct article: the tooltips are
+    # collected in row order and assigned as a column, without a unique() pass and a map() lookup.
+    # Обе объединенные стороны содержат по одной строке на артикул, поэтому каждая строка - уникальный артикул:
+    # подсказки собираются в порядке строк и присваиваются колонкой, без прохода unique() и поиска через map().
+    cached_tooltips = cache.get("tooltips", {})
+    current_tooltips = {}
+    tooltips = []
+    for a in orders_agg["ARTIKELNR"].tolist():
+        tooltip_key = (a, manual_qty_map.get(a, 0))
+        tooltip = cached_tooltips.get(tooltip_key)
+        if tooltip is None:
+            tooltip = make_order_tooltip(a, orders_detail_map, manual_qty_map, STR)
+        current_tooltips[tooltip_key] = tooltip
+        tooltips.append(tooltip)
+    cache["tooltips"] = current_tooltips
+    orders_agg["ORDER_TOOLTIP"] = tooltips
+
+    return orders_agg
+
+
 # ---------- Main function for 'Orders' tab ----------
 # ---------- Главная функция для вкладки 'Заказы' ----------
 
@@ -897,7 +1383,7 @@ def render_orders_tab(artikel_options, filtered_pallets_df=None, selected_artike
     # Displays pallet list, order uploads, and comparison.
     # Отображает список паллет, загрузку заказов и сравнение.
     
-    from utils import load_excluded_articles
+    from utils import load_excluded_articles_normalized
 
     
     # --- 1. Pallet List Section ---
@@ -918,24 +1404,31 @@ def render_orders_tab(artikel_options, filtered_pallets_df=None, selected_artike
             "OUT_TIME",
         ]
 
-        df_show = filtered_pallets_df[cols_show].sort_values(by="OUT_DATE", ascending=False).reset_index(drop=True)
-        
-        # Format dates.
-        # Форматирование дат.
-        df_show["IN_DATE"] = df_show["IN_DATE"].dt.date
-        df_show["OUT_DATE"] = df_show["OUT_DATE"].dt.date
-
-        st.dataframe(df_show, width="stretch", hide_index=True)
+        # Sort positions are taken from the single OUT_DATE column, and the rows and columns are then gathered
+        # in one take, instead of copying the projection first and the sorted frame again.
+        # Позиции сортировки берутся из одной колонки OUT_DATE, затем строки и колонки собираются одним take,
+        # вместо копирования сначала проекции, а затем еще раз отсортированного DataFrame.
+        show_order = filtered_pallets_df["OUT_DATE"].reset_index(drop=True).sort_values(ascending=False).index
+        df_show = filtered_pallets_df.iloc[
+            show_order, filtered_pallets_df.columns.get_indexer(cols_show)
+        ].reset_index(drop=True)
+
+        # Dates stay datetime64; the column config renders them without the time part.
+        # Даты остаются datetime64; конфигурация колонок отображает их без времени.
+        st.dataframe(
+            df_show,
+            width="stretch",
+            hide_index=True,
+            column_config=date_columns_config("IN_DATE", "OUT_DATE"),
+        )
         
         # Summary of visible pallets.
         # Сводка видимых паллет.
         st.markdown(f"#### {STR['pallet_list_summary']}")
-        # observed=True is required when grouping by categorical columns to avoid expanding all categories.
-        # observed=True требуется при группировке по категориальным колонкам, чтобы избежать развертывания всех категорий.
-        df_list_agg = filtered_pallets_df.groupby(["ARTIKELNR", "ARTBEZ1"], as_index=False, observed=True).agg(
-            Liczba_palet=("LHMNR", "nunique"),
-            Suma_sztuk=("QUANTITY", "sum")
-        ).rename(columns={"Liczba_palet": "Liczba palet", "Suma_sztuk": "Suma sztuk"}).sort_values("Liczba palet", ascending=False)
+        df_list_agg = aggregate_pallets(
+            filtered_pallets_df[["ARTIKELNR", "ARTBEZ1", "LHMNR", "QUANTITY"]],
+            ["ARTIKELNR", "ARTBEZ1"], "Liczba palet", "Suma sztuk",
+        ).sort_values("Liczba palet", ascending=False)
         st.dataframe(df_list_agg, width="stretch", hide_index=True)
 
         # Detailed daily analytics.
@@ -946,28 +1439,52 @@ def render_orders_tab(artikel_options, filtered_pallets_df=None, selected_artike
             elif full_df is not None and selected_mandant and date_start and date_end:
                 # Prepare data for daily breakdown.
                 # Подготовка данных для ежедневной разбивки.
-                
-                mask_base = (full_df["MANDANT"].astype(str) == str(selected_mandant))
-                mask_base &= full_df["ARTIKELNR"].isin([a.strip().upper() for a in selected_artikel])
-                df_subset = full_df[mask_base]
+
+                # Selected articles are canonical ARTIKELNR categories (see render_analysis_filters), so they
+                # are only de-duplicated; a sorted tuple is hashable and stable between reruns.
+                # Выбранные артикулы - канонические категории ARTIKELNR (см. render_analysis_filters), поэтому
+                # они только очищаются от дублей; отсортированный кортеж хешируем и стабилен между перезапусками.
+                artikel_norm = tuple(sorted(set(selected_artikel)))
+
+                # MANDANT and ARTIKELNR are categorical (see load_main_csv). The rows of the few selected
+                # articles are found on the ARTIKELNR codes first, and the mandant is then checked through
+                # its category code on those rows only, instead of comparing the whole MANDANT column.
+                # MANDANT и ARTIKELNR категориальные (см. load_main_csv). Строки нескольких выбранных артикулов
+                # сначала находятся по кодам ARTIKELNR, а мандант затем проверяется по коду категории только
+                # в этих строках, вместо сравнения всей колонки MANDANT.
+                base_rows = np.flatnonzero(full_df["ARTIKELNR"].isin(artikel_norm).to_numpy())
+                mandant_col = full_df["MANDANT"]
+                mandant_code = mandant_col.cat.categories.get_indexer([str(selected_mandant)])[0]
+                if mandant_code >= 0:
+                    base_rows = base_rows[mandant_col.cat.codes.to_numpy()[base_rows] == mandant_code]
+                else:
+                    base_rows = base_rows[:0]
+
+                # Take only the columns used below, so the slice does not copy the whole wide frame.
+                # Берем только используемые ниже колонки, чтобы срез не копировал весь широкий DataFrame.
+                daily_cols = ["ARTIKELNR", "LHMNR", "QUANTITY", "IN_DATE", "OUT_DATE", "IS_DELETED"]
+                df_subset = full_df.iloc[base_rows, full_df.columns.get_indexer(daily_cols)]
 
                 # Receipts.
                 # Поступления.
-                mask_in = df_subset["IN_DATE"].between(pd.Timestamp(date_start), pd.Timestamp(date_end))
-                df_in = df_subset[mask_in].copy()
+                mask_in = date_range_mask(df_subset["IN_DATE"], date_start, date_end)
+                # aggregate_pallets only reads its input, so the boolean slices need no defensive copies.
+                # aggregate_pallets только читает входные данные, поэтому булевым срезам не нужны защитные копии.
+                df_in = df_subset[mask_in]
 
                 if not df_in.empty:
-                    # Group by article and date. observed=True handles categorical ARTIKELNR correctly.
-                    # Группируем по артикулу и дате. observed=True корректно обрабатывает категориальный ARTIKELNR.
-                    daily_accepted = df_in.groupby(["ARTIKELNR", "IN_DATE"], as_index=False, observed=True).agg(
-                        Palety_przyjęte=("LHMNR", "nunique"),
-                        Sztuki_przyjęte=("QUANTITY", "sum")
-                    )
-                    daily_accepted["IN_DATE"] = daily_accepted["IN_DATE"].dt.date
+                    # Group by article and date.
+                    # Группируем по артикулу и дате.
+                    daily_accepted = aggregate_pallets(df_in, ["ARTIKELNR", "IN_DATE"], "Palety_przyjęte", "Sztuki_przyjęte", sort=False)
                     daily_accepted = daily_accepted.sort_values(["ARTIKELNR", "IN_DATE"], ascending=[True, False])
                     
                     st.subheader(STR["daily_receipts"])
-                    st.dataframe(daily_accepted, width="stretch", hide_index=True)
+                    st.dataframe(
+                        daily_accepted,
+                        width="stretch",
+                        hide_index=True,
+                        column_config=date_columns_config("IN_DATE"),
+                    )
                 else:
                     st.info(STR["daily_no_receipts"])
 
@@ -975,26 +1492,24 @@ def render_orders_tab(artikel_options, filtered_pallets_df=None, selected_artike
 
                 # Removals.
                 # Удаления.
-                mask_out = df_subset["OUT_DATE"].between(pd.Timestamp(date_start), pd.Timestamp(date_end))
-                if "IS_DELETED" in df_subset.columns:
-                    mask_deleted = df_subset["IS_DELETED"]
-                else:
-                    mask_deleted = df_subset["ZUSTAND"] != "401"
-                
-                df_out = df_subset[mask_out & mask_deleted].copy()
+                mask_out = date_range_mask(df_subset["OUT_DATE"], date_start, date_end)
+                # IS_DELETED is a bool column computed once in load_main_csv.
+                # IS_DELETED - булева колонка, вычисляемая один раз в load_main_csv.
+                df_out = df_subset[mask_out & df_subset["IS_DELETED"].to_numpy()]
 
                 if not df_out.empty:
-                    # Group by article and date. observed=True handles categorical ARTIKELNR correctly.
-                    # Группируем по артикулу и дате. observed=True корректно обрабатывает категориальный ARTIKELNR.
-                    daily_deleted = df_out.groupby(["ARTIKELNR", "OUT_DATE"], as_index=False, observed=True).agg(
-                        Palety_usunięte=("LHMNR", "nunique"),
-                        Sztuki_usunięte=("QUANTITY", "sum")
-                    )
-                    daily_deleted["OUT_DATE"] = daily_deleted["OUT_DATE"].dt.date
+                    # Group by article and date.
+                    # Группируем по артикулу и дате.
+                    daily_deleted = aggregate_pallets(df_out, ["ARTIKELNR", "OUT_DATE"], "Palety_usunięte", "Sztuki_usunięte", sort=False)
                     daily_deleted = daily_deleted.sort_values(["ARTIKELNR", "OUT_DATE"], ascending=[True, False])
                     
                     st.subheader(STR["daily_removals"])
-                    st.dataframe(daily_deleted, width="stretch", hide_index=True)
+                    st.dataframe(
+                        daily_deleted,
+                        width="stretch",
+                        hide_index=True,
+                        column_config=date_columns_config("OUT_DATE"),
+                    )
                 else:
                     st.info(STR["daily_no_removals"])
             else:
@@ -1030,6 +1545,7 @@ def render_orders_tab(artikel_options, filtered_pallets_df=None, selected_artike
                 "orders_all": None,
                 "orders_agg": None,
                 "orders_detail_map": {},
+                "files_sources_count": None,
                 "valid_count": 0,
             }
             st.session_state["orders_uploader_key"] += 1
@@ -1048,73 +1564,37 @@ def render_orders_tab(artikel_options, filtered_pallets_df=None, selected_artike
 
     # Check if any order data exists.
     # Проверка наличия данных заказов.
-    manual_df = st.session_state.get("manual_orders_committed_df", pd.DataFrame(
-        {"ARTIKELNR": [], "ORDER_PALLETS": [], "ORDER_QTY": []}
-    ))
+    # The per-article manual sums are reused across reruns until the manual rows change.
+    # Суммы ручных заказов по артикулам переиспользуются между перезапусками, пока ручные строки не изменятся.
+    manual_agg = get_manual_orders_agg()
 
-    if orders_agg_base is None and manual_df.empty:
+    if orders_agg_base is None and manual_agg is None:
         st.info(STR["no_orders_data"])
         return
 
     # Combine file orders and manual orders.
     # Объединение заказов из файлов и ручных заказов.
-    manual_agg = None
-    if not manual_df.empty:
-        m = manual_df.copy()
-        m["ARTIKELNR"] = m["ARTIKELNR"].astype(str).str.strip().str.upper()
-        m["ORDER_PALLETS"] = pd.to_numeric(m["ORDER_PALLETS"], errors="coerce").fillna(0).astype(int)
-        m["ORDER_QTY"] = pd.to_numeric(m["ORDER_QTY"], errors="coerce").fillna(0)
-
-        manual_agg = m.groupby("ARTIKELNR", as_index=False).agg(
-            Manual_Pallets=("ORDER_PALLETS", "sum"),
-            Manual_Qty=("ORDER_QTY", "sum"),
-        )
-
-    if orders_agg_base is not None:
-        orders_agg = orders_agg_base.copy()
-    else:
-        orders_agg = pd.DataFrame(columns=["ARTIKELNR", "ORDER_PALLETS", "ORDER_QTY"])
-
-    if manual_agg is not None and not manual_agg.empty:
-        orders_agg = orders_agg.merge(manual_agg, on="ARTIKELNR", how="outer")
-    else:
-        orders_agg["Manual_Pallets"] = 0
-        orders_agg["Manual_Qty"] = 0
-
-    # Normalize numeric columns.
-    # Нормализация числовых колонок.
-    for col in ["ORDER_PALLETS", "Manual_Pallets"]:
-        orders_agg[col] = pd.to_numeric(orders_agg[col], errors="coerce").fillna(0).astype(int)
-    for col in ["ORDER_QTY", "Manual_Qty"]:
-        orders_agg[col] = pd.to_numeric(orders_agg[col], errors="coerce").fillna(0)
-
-    orders_agg["Ordered_Pallets_Total"] = orders_agg["ORDER_PALLETS"] + orders_agg["Manual_Pallets"]
-    orders_agg["Ordered_Qty_Total"] = orders_agg["ORDER_QTY"] + orders_agg["Manual_Qty"]
-
-    # Calculate sources count.
-    # Подсчет количества источников.
+    # The combined table depends only on the file aggregate, the manual sums and the UI language, so it
+    # is reused from orders_cache across reruns caused by other widgets (filters, dates, expanders).
+    # The cached objects are compared by identity: both are replaced, never mutated, when they change.
+    # Объединенная таблица зависит только от агрегата файлов, ручных сумм и языка интерфейса, поэтому
+    # она переиспользуется из orders_cache между перезапусками от других виджетов (фильтры, даты, раскрывашки).
+    # Кешированные объекты сравниваются по идентичности: при изменении они заменяются, а не изменяются.
     cache = st.session_state.get("orders_cache", {})
-    orders_detail_map = cache.get("orders_detail_map", {})
-
-    def sources_count(row):
-        art = str(row["ARTIKELNR"]).strip().upper()
-        files_sources = sum(1 for _, qty in orders_detail_map.get(art, {}).items() if qty != 0)
-        manual_source = 1 if row.get("Manual_Qty", 0) > 0 else 0
-        return files_sources + manual_source
-
-    def is_excluded_article(art, excluded_exact, excluded_prefixes):
-        art = str(art).strip().upper()
-        if art in [e.upper() for e in excluded_exact]:
-            return True
-        for p in excluded_prefixes:
-            if art.startswith(p.upper()):
-                return True
-        return False
-
-    orders_agg["SOURCES_CNT"] = orders_agg.apply(sources_count, axis=1)
-    orders_agg["ORDER_TOOLTIP"] = orders_agg["ARTIKELNR"].apply(
-        lambda a: make_order_tooltip(a, orders_detail_map, manual_agg, STR)
-    )
+    view_key = (STR["manual_orders"], STR.get("tooltip_no_info"))
+    if (
+        cache.get("orders_view") is not None
+        and cache.get("orders_view_base") is orders_agg_base
+        and cache.get("orders_view_manual") is manual_agg
+        and cache.get("orders_view_key") == view_key
+    ):
+        orders_agg = cache["orders_view"]
+    else:
+        orders_agg = build_orders_view(orders_agg_base, manual_agg, cache, STR)
+        cache["orders_view"] = orders_agg
+        cache["orders_view_base"] = orders_agg_base
+        cache["orders_view_manual"] = manual_agg
+        cache["orders_view_key"] = view_key
 
     # Display aggregated orders table.
     # Отображение таблицы агрегированных заказов.
@@ -1144,76 +1624,80 @@ def render_orders_tab(artikel_options, filtered_pallets_df=None, selected_artike
             st.markdown("---")
             st.subheader(f"⚖️ {STR['compare']}")
 
-            deleted_pallets = df_for_comparison[df_for_comparison["IS_DELETED"]].copy()
+            # Count deletions on the bool column first; the common "nothing deleted" case then skips slicing entirely.
+            # Сначала считаем удаления по булевой колонке; частый случай "ничего не удалено" вообще не делает срез.
+            is_deleted = df_for_comparison["IS_DELETED"]
+            n_del = int(is_deleted.sum())
+
+            if n_del:
+                deleted_pallets = df_for_comparison.loc[is_deleted, ["ARTIKELNR", "LHMNR", "QUANTITY", "OUT_DATE"]]
 
-            if not deleted_pallets.empty:
                 # Aggregate deleted pallets.
                 # Агрегация удаленных паллет.
-                # observed=True ensures we only count existing categories.
-                # observed=True гарантирует, что мы считаем только существующие категории.
-                deleted_agg = deleted_pallets.groupby("ARTIKELNR", as_index=False, observed=True).agg(
-                    Deleted_Pallets=("LHMNR", "nunique"),
-                    Deleted_Qty=("QUANTITY", "sum"),
-                )
+                deleted_agg = aggregate_deletions(deleted_pallets)
 
                 # Merge orders and deletions.
                 # Объединение заказов и удалений.
+                # Only the four numeric columns can be missing after the outer join, so fill just those.
+                # После внешнего объединения пропуски возможны только в четырех числовых колонках, поэтому заполняем только их.
                 comparison_df = orders_agg[["ARTIKELNR", "Ordered_Pallets_Total", "Ordered_Qty_Total"]].merge(
-                    deleted_agg, on="ARTIKELNR", how="outer"
-                ).fillna(0)
-
-                comparison_df["Różnica_Palety"] = (
-                    comparison_df["Ordered_Pallets_Total"] - comparison_df["Deleted_Pallets"]
+                    deleted_agg, on="ARTIKELNR", how="outer", sort=False
+                ).fillna({
+                    "Ordered_Pallets_Total": 0,
+                    "Ordered_Qty_Total": 0,
+                    "Deleted_Pallets": 0,
+                    "Deleted_Qty": 0,
+                })
+
+                # The differences are computed as arrays and attached only to the rows kept below, so the
+                # filter does not copy two extra full-length columns.
+                # Разницы вычисляются как массивы и добавляются только к оставленным ниже строкам, поэтому
+                # фильтр не копирует две лишние колонки полной длины.
+                pal_diff_values = (
+                    comparison_df["Ordered_Pallets_Total"].to_numpy() - comparison_df["Deleted_Pallets"].to_numpy()
                 )
-                comparison_df["Różnica_Sztuki"] = (
-                    comparison_df["Ordered_Qty_Total"] - comparison_df["Deleted_Qty"]
+                qty_diff_values = (
+                    comparison_df["Ordered_Qty_Total"].to_numpy() - comparison_df["Deleted_Qty"].to_numpy()
                 )
 
                 # Filter rows based on differences and exclusions.
                 # Фильтрация строк на основе различий и исключений.
-                excluded_exact, excluded_prefixes = load_excluded_articles()
+                excluded_exact, excluded_prefixes = load_excluded_articles_normalized()
                 
-                def should_show_row(row):
-                    art = row["ARTIKELNR"].strip().upper()
-                    if is_excluded_article(art, excluded_exact, excluded_prefixes):
-                        # For excluded articles, show only if BOTH differences are non-zero.
-                        # Для исключенных артикулов показывать только если ОБА различия не равны нулю.
-                        return (row["Różnica_Palety"] != 0) and (row["Różnica_Sztuki"] != 0)
-                    else:
-                        # For regular articles, show if ANY difference exists.
-                        # Для обычных артикулов показывать, если есть ХОТЯ БЫ ОДНО различие.
-                        return (row["Różnica_Palety"] != 0) or (row["Różnica_Sztuki"] != 0)
-                
-                comparison_df = comparison_df[comparison_df.apply(should_show_row, axis=1)]
-
+                pal_diff = pal_diff_values != 0
+                qty_diff = qty_diff_values != 0
+                # For excluded articles, show only if BOTH differences are non-zero;
+                # for regular articles, show if ANY difference exists.
+                # Rows with both or neither difference are decided without the exclusion list, so the string
+                # matching only runs on rows with exactly one difference.
+                # Для исключенных артикулов показывать только если ОБА различия не равны нулю;
+                # для обычных артикулов показывать, если есть ХОТЯ БЫ ОДНО различие.
+                # Строки с обоими различиями или без них решаются без списка исключений, поэтому сравнение строк
+                # выполняется только для строк ровно с одним различием.
+                keep = pal_diff & qty_diff
+                one_diff = pal_diff ^ qty_diff
+                if one_diff.any():
+                    keep[one_diff] = ~excluded_articles_mask(
+                        comparison_df["ARTIKELNR"][one_diff], excluded_exact, excluded_prefixes
+                    )
+                comparison_df = comparison_df[keep].assign(**{
+                    "Różnica_Palety": pal_diff_values[keep],
+                    "Różnica_Sztuki": qty_diff_values[keep],
+                })
 
                 # Generate explanation text.
                 # Генерация текста пояснения.
-                def explain_diff(row):
-                    diff_pal = row["Różnica_Palety"]
-                    diff_szt = row["Różnica_Sztuki"]
-
-                    if diff_pal == 0 and diff_szt == 0:
-                        return STR["diff_none"]
-                    msgs = []
-
-                    if diff_pal > 0:
-                        msgs.append(STR["diff_pallets_less"].format(val=int(abs(diff_pal))))
-                    elif diff_pal < 0:
-                        msgs.append(STR["diff_pallets_more"].format(val=int(abs(diff_pal))))
-                    else:
-                        msgs.append(STR["diff_pallets_none"])
-
-                    if diff_szt > 0:
-                        msgs.append(STR["diff_qty_missing"].format(val=int(abs(diff_szt))))
-                    elif diff_szt < 0:
-                        msgs.append(STR["diff_qty_excess"].format(val=int(abs(diff_szt))))
-                    else:
-                        msgs.append(STR["diff_qty_none"])
-
-                    return ", ".join(msgs)
-
-                comparison_df["Wyjaśnienie różnicy"] = comparison_df.apply(explain_diff, axis=1)
+                # Each message part is picked per row by diff_messages, then the parts are joined column-wise.
+                # Каждая часть сообщения выбирается для строки через diff_messages, затем части склеиваются по колонкам.
+                diff_pal = comparison_df["Różnica_Palety"]
+                diff_szt = comparison_df["Różnica_Sztuki"]
+                pal_msg = diff_messages(diff_pal, STR["diff_pallets_less"], STR["diff_pallets_more"], STR["diff_pallets_none"])
+                szt_msg = diff_messages(diff_szt, STR["diff_qty_missing"], STR["diff_qty_excess"], STR["diff_qty_none"])
+                # Every kept row has at least one non-zero difference (see the keep mask above), so the
+                # "no difference" text can never apply here and the parts are joined directly.
+                # Каждая оставленная строка имеет хотя бы одну ненулевую разницу (см. маску keep выше), поэтому
+                # текст "нет разницы" здесь не может применяться, и части склеиваются напрямую.
+                comparison_df["Wyjaśnienie różnicy"] = pal_msg + ", " + szt_msg
 
                 comparison_df = comparison_df.sort_values("Różnica_Palety", ascending=False).reset_index(drop=True)
 
@@ -1221,9 +1705,12 @@ def render_orders_tab(artikel_options, filtered_pallets_df=None, selected_artike
                 # --- Анализ ежедневной разбивки ---
                 is_date_range = date_start and date_end and (date_end.date() - date_start.date()).days > 0
 
+                # Default for every row; only articles with daily differences are overwritten below.
+                # Значение по умолчанию для всех строк; ниже перезаписываются только артикулы с дневными различиями.
+                if is_date_range:
+                    comparison_df["Dni z różnicą"] = "-"
+
                 if is_date_range and orders_all is not None and "ORDER_DATE" in orders_all.columns and not orders_all.empty:
-                    orders_valid = orders_all.dropna(subset=["ORDER_DATE"]).copy()
-                    
                     # Warn about files without dates.
                     # Предупреждение о файлах без дат.
                     missing_date_mask = orders_all["ORDER_DATE"].isna()
@@ -1234,50 +1721,86 @@ def render_orders_tab(artikel_options, filtered_pallets_df=None, selected_artike
                                 STR["diff_days_warning"].format(count=len(missing_files), example=missing_files[0])
                             )
 
+                    # The missing-date mask is reused for the slice, which takes only the three grouped columns
+                    # and is not copied. sort=False: row order is irrelevant, daily_diffs is sorted by DATE below.
+                    # Маска пустых дат переиспользуется для среза, который берет только три нужные колонки
+                    # и не копируется. sort=False: порядок строк не важен, daily_diffs ниже сортируется по DATE.
+                    orders_valid = orders_all.loc[~missing_date_mask, ["ARTIKELNR", "ORDER_DATE", "ORDER_PALLETS"]]
                     if not orders_valid.empty:
-                        orders_daily = orders_valid.groupby(["ARTIKELNR", "ORDER_DATE"], as_index=False)["ORDER_PALLETS"].sum()
-                        orders_daily.rename(columns={"ORDER_DATE": "DATE", "ORDER_PALLETS": "ORD"}, inplace=True)
+                        # ORDER_DATE and the normalized OUT_DATE below are both datetime64, so the grouping
+                        # and the merge hash int64 day values.
+                        # ORDER_DATE и нормализованная OUT_DATE ниже - обе datetime64, поэтому группировка
+                        # и объединение хешируют значения дней int64.
+                        orders_daily = orders_valid.groupby(
+                            [orders_valid["ARTIKELNR"], orders_valid["ORDER_DATE"].rename("DATE")],
+                            sort=False,
+                        )["ORDER_PALLETS"].sum().reset_index(name="ORD")
                     else:
-                        orders_daily = pd.DataFrame(columns=["ARTIKELNR", "DATE", "ORD"])
+                        orders_daily = pd.DataFrame({
+                            "ARTIKELNR": pd.Series(dtype=object),
+                            "DATE": pd.Series(dtype="datetime64[ns]"),
+                            "ORD": pd.Series(dtype="float64"),
+                        })
                     
-                    if not deleted_pallets.empty:
-                        del_daily = deleted_pallets.copy()
-                        del_daily["DATE"] = del_daily["OUT_DATE"].dt.date
-                        # Group by article and date. observed=True handles categorical ARTIKELNR correctly.
-                        # Группируем по артикулу и дате. observed=True корректно обрабатывает категориальный ARTIKELNR.
-                        del_daily_agg = del_daily.groupby(["ARTIKELNR", "DATE"], as_index=False, observed=True)["LHMNR"].nunique()
-                        del_daily_agg.rename(columns={"LHMNR": "DEL"}, inplace=True)
-                    else:
-                        del_daily_agg = pd.DataFrame(columns=["ARTIKELNR", "DATE", "DEL"])
-
-                    # Merge daily data and calculate differences.
-                    # Объединение ежедневных данных и расчет различий.
-                    if not orders_daily.empty or not del_daily_agg.empty:
-                        daily_merged = pd.merge(orders_daily, del_daily_agg, on=["ARTIKELNR", "DATE"], how="outer").fillna(0)
-                        daily_merged["DIFF"] = daily_merged["ORD"] - daily_merged["DEL"]
+                    # deleted_pallets is non-empty here (n_del > 0). Its groups are not sorted, since the daily
+                    # differences are sorted by DATE below; the per-article totals come from deleted_agg, as a
+                    # pallet with rows on several days would be counted once per day here.
+                    # Здесь deleted_pallets не пуст (n_del > 0). Его группы не сортируются, так как дневные
+                    # различия ниже сортируются по DATE; итоги по артикулам берутся из deleted_agg, так как
+                    # паллета со строками в разные дни здесь была бы посчитана по разу на день.
+                    del_daily_agg = aggregate_daily_deletions(deleted_pallets)
+
+                    # Merge daily data and calculate differences (del_daily_agg is never empty here).
+                    # Only the count columns are filled: ARTIKELNR may stay categorical and reject a 0 fill value.
+                    # Объединение ежедневных данных и расчет различий (del_daily_agg здесь никогда не пуст).
+                    # Заполняются только колонки счетчиков: ARTIKELNR может остаться категориальным и не принять 0.
+                    # Row order is irrelevant (daily_diffs is sorted by DATE below) and both inputs are fresh
+                    # frames, so the merge neither sorts the keys nor copies its inputs.
+                    # Порядок строк не важен (daily_diffs ниже сортируется по DATE), а оба входа - новые
+                    # DataFrame, поэтому объединение не сортирует ключи и не копирует входные данные.
+                    daily_merged = pd.merge(
+                        orders_daily, del_daily_agg, on=["ARTIKELNR", "DATE"], how="outer", sort=False, copy=False
+                    ).fillna({"ORD": 0, "DEL": 0})
+                    daily_merged["DIFF"] = daily_merged["ORD"] - daily_merged["DEL"]
+
+                    # Zero-difference days are dropped before sorting and formatting; sort_values already
+                    # returns a new frame, so the slice needs no copy.
+                    # Дни без разницы отбрасываются до сортировки и форматирования; sort_values и так
+                    # возвращает новый DataFrame, поэтому срезу не нужна копия.
+                    daily_diffs = daily_merged[daily_merged["DIFF"].to_numpy() != 0]
+
+                    if not daily_diffs.empty:
+                        daily_diffs = daily_diffs.sort_values("DATE")
+
+                        # Each distinct day is formatted once and spread back by run index, since strftime formats
+                        # element by element. The rows are already sorted by DATE, so the distinct days are the
+                        # starts of equal runs and no second sort (np.unique) is needed.
+                        # Каждый уникальный день форматируется один раз и раскладывается обратно по номеру серии, так как
+                        # strftime форматирует поэлементно. Строки уже отсортированы по DATE, поэтому уникальные дни -
+                        # начала серий равных значений, и вторая сортировка (np.unique) не нужна.
+                        dates = daily_diffs["DATE"].to_numpy()
+                        run_start = np.empty(len(dates), dtype=bool)
+                        run_start[0] = True
+                        np.not_equal(dates[1:], dates[:-1], out=run_start[1:])
+                        day_idx = np.cumsum(run_start) - 1
+                        day_labels = pd.DatetimeIndex(dates[run_start]).strftime("%d.%m").to_numpy(dtype=object)[day_idx]
+                        diff_vals = daily_diffs["DIFF"].astype(int)
+                        daily_diffs["TXT"] = (
+                            day_labels
+                            + ": "
+                            + np.where(diff_vals > 0, "+", "")
+                            + diff_vals.astype(str)
+                        )
                         
-                        daily_diffs = daily_merged[daily_merged["DIFF"] != 0].copy()
+                        # agg with the str.join builtin avoids a Python lambda call per group.
+                        # agg со встроенным str.join избегает вызова Python-лямбды для каждой группы.
+                        # The result stays a Series indexed by article: map() looks the articles up in that index
+                        # directly, while a dict would be converted back into a Series inside map().
+                        # Результат остается Series с индексом по артикулу: map() ищет артикулы прямо в этом индексе,
+                        # а словарь внутри map() снова преобразовывался бы в Series.
+                        daily_map = daily_diffs.groupby("ARTIKELNR", sort=False, observed=True)["TXT"].agg("\n".join)
                         
-                        if not daily_diffs.empty:
-                            daily_diffs = daily_diffs.sort_values("DATE")
-                            
-                            def fmt_diff(row):
-                                d_str = row["DATE"].strftime("%d.%m")
-                                val = int(row["DIFF"])
-                                sign = "+" if val > 0 else ""
-                                return f"{d_str}: {sign}{val}"
-
-                            daily_diffs["TXT"] = daily_diffs.apply(fmt_diff, axis=1)
-                            
-                            daily_map = daily_diffs.groupby("ARTIKELNR")["TXT"].apply(lambda x: "\n".join(x)).to_dict()
-                            
-                            comparison_df["Dni z różnicą"] = comparison_df["ARTIKELNR"].map(daily_map).fillna("-")
-                        else:
-                            comparison_df["Dni z różnicą"] = "-"
-                    else:
-                        comparison_df["Dni z różnicą"] = "-"
-                elif is_date_range:
-                    comparison_df["Dni z różnicą"] = "-"
+                        comparison_df["Dni z różnicą"] = comparison_df["ARTIKELNR"].map(daily_map).fillna("-")
 
                 # Rename columns for display.
                 # Переименование колонок для отображения.
@@ -25,23 +25,35 @@ def filter_stock_df(df, selected_mandant, selected_artikel, selected_date):
 
     # 🎯 STEP 1: Base mandant filter.
     # 🎯 ШАГ 1: Базовый фильтр по манданту.
-    df_filtered = df[df["MANDANT"].astype(str) == selected_mandant].copy()
+    # MANDANT is categorical (see load_main_csv), so comparing with the string compares integer codes
+    # without casting the whole column to str.
+    # MANDANT категориальный (см. load_main_csv), поэтому сравнение со строкой сравнивает целочисленные коды
+    # без приведения всей колонки к str.
+    mask_mandant = df["MANDANT"] == str(selected_mandant)
 
     # 🎯 STEP 2: STRICT DATE FILTRATION.
     # 🎯 ШАГ 2: СТРОГАЯ ФИЛЬТРАЦИЯ ПО ДАТЕ.
     
     # Condition 1: Received before the selected date.
     # Условие 1: Принято до выбранной даты.
-    mask_in = df_filtered["IN_DATE"].dt.date < selected_date.date()
+    # Dates are compared as datetime64 against midnight of the selected day, which matches comparing
+    # .dt.date values without boxing every cell into a Python date (NaT compares False either way).
+    # Даты сравниваются как datetime64 с полуночью выбранного дня, что совпадает со сравнением значений
+    # .dt.date без упаковки каждой ячейки в Python date (NaT в обоих случаях дает False).
+    day_start = pd.Timestamp(selected_date.date())
+    mask_in = df["IN_DATE"] < day_start
     
     # Condition 2: Currently in stock (401) OR removed on/after the selected date.
     # Условие 2: Текущий статус на складе (401) ИЛИ удалено в/после выбранной даты.
-    mask_is_401 = df_filtered["ZUSTAND"].astype(str) == "401"
-    mask_removed_later = df_filtered["OUT_DATE"].dt.date >= selected_date.date()
+    # IS_DELETED (ZUSTAND != 401) is precomputed in load_main_csv.
+    # IS_DELETED (ZUSTAND != 401) предварительно вычисляется в load_main_csv.
+    mask_removed_later = df["OUT_DATE"] >= day_start
     
-    mask_out_logic = mask_is_401 | mask_removed_later
+    mask_out_logic = ~df["IS_DELETED"] | mask_removed_later
     
-    df_stock_raw = df_filtered[mask_in & mask_out_logic].copy()
+    # All conditions are combined first, so only the matching rows are copied once.
+    # Все условия сначала объединяются, поэтому копируются один раз только подходящие строки.
+    df_stock_raw = df[mask_mandant & mask_in & mask_out_logic]
         
     # 🎯 STEP 3: DEDUPLICATION BY LHMNR (PID).
     # 🎯 ШАГ 3: ДЕДУПЛИКАЦИЯ ПО LHMNR (PID).
@@ -53,9 +65,10 @@ def filter_stock_df(df, selected_mandant, selected_artikel, selected_date):
     
     # 🎯 STEP 4: Article filter.
     # 🎯 ШАГ 4: Фильтр по артикулу.
+    # The selection comes from ARTIKELNR values, which load_main_csv already stripped and upper-cased.
+    # Выбор берется из значений ARTIKELNR, которые load_main_csv уже обрезал и перевел в верхний регистр.
     if selected_artikel:
-        artikel_list = [a.strip().upper() for a in selected_artikel]
-        df_stock = df_stock[df_stock["ARTIKELNR"].isin(artikel_list)].copy()
+        df_stock = df_stock[df_stock["ARTIKELNR"].isin(selected_artikel)].copy()
 
     # 🎯 STEP 5: Packaging classification (Cartons vs Others).
     # 🎯 ШАГ 5: Классификация упаковки (Картоны vs Остальные).
@@ -185,7 +198,9 @@ def render_stock_tab(df, selected_mandant, selected_artikel, STR):
     col_stock_mandant, col_stock_date, col_stock_artikel = st.columns([1, 1.5, 2])
 
     with col_stock_mandant:
-        available_mandants_stock = sorted(df["MANDANT"].astype(str).unique())
+        # Sorted MANDANT categories (never NaN), as in render_analysis_filters.
+        # Отсортированные категории MANDANT (без NaN), как в render_analysis_filters.
+        available_mandants_stock = df["MANDANT"].cat.categories.tolist()
         selected_mandant_stock = st.selectbox(STR["mandant"], options=available_mandants_stock, index=0, key="stock_mandant_filter")
 
     with col_stock_date:
@@ -194,7 +209,14 @@ def render_stock_tab(df, selected_mandant, selected_artikel, STR):
         selected_date_stock = datetime.combine(stock_date, datetime.min.time())
 
     with col_stock_artikel:
-        artikel_stock_options = sorted(df[df["MANDANT"].astype(str) == selected_mandant_stock]["ARTIKELNR"].dropna().unique().tolist())
+        # Sorted categories of the mandant's articles, as in render_analysis_filters.
+        # Отсортированные категории артикулов манданта, как в render_analysis_filters.
+        artikel_stock_options = (
+            df.loc[df["MANDANT"] == selected_mandant_stock, "ARTIKELNR"]
+            .cat.remove_unused_categories()
+            .cat.categories
+            .tolist()
+        )
         selected_artikel_stock = st.multiselect(STR["stock_articles"], options=artikel_stock_options, default=[], key="stock_artikel_filter")
 
     # Checkbox for showing only cartons (only for Mandant 352).
@@ -4,6 +4,7 @@
 
 import json
 import os
+import pandas as pd
 import streamlit as st
 
 EXCLUDED_ARTICLES_FILE = "excluded_articles.json"
@@ -26,6 +27,22 @@ def load_excluded_articles():
             
     return [], []
 
+@st.cache_resource
+def load_excluded_articles_normalized():
+    # Returns excluded articles already upper-cased, ready for fast lookups.
+    # Возвращает исключенные артикулы уже в верхнем регистре, готовые для быстрого поиска.
+    # Returns: Tuple (exact_matches_frozenset, prefixes_tuple).
+    # Cached once per server process; cleared in save_excluded_articles().
+    # Кэшируется один раз на процесс сервера; сбрасывается в save_excluded_articles().
+    # Entries are stripped like the articles they are compared with; blank prefixes are dropped,
+    # since str.startswith("") would match (and exclude) every article.
+    # Записи обрезаются так же, как сравниваемые артикулы; пустые префиксы отбрасываются,
+    # так как str.startswith("") совпал бы (и исключил) любой артикул.
+    exact_list, prefix_list = load_excluded_articles()
+    exact = frozenset(str(e).strip().upper() for e in exact_list)
+    prefixes = tuple(dict.fromkeys(p for p in (str(p).strip().upper() for p in prefix_list) if p))
+    return exact, prefixes
+
 def save_excluded_articles(exact_list, prefix_list):
     # Saves the list of excluded articles to the local JSON file.
     # Сохраняет список исключенных артикулов в локальный JSON-файл.
@@ -38,6 +55,9 @@ def save_excluded_articles(exact_list, prefix_list):
     try:
         with open(EXCLUDED_ARTICLES_FILE, "w", encoding="utf-8") as f:
             json.dump(data, f, indent=2, ensure_ascii=False)
+        # Invalidate the normalized cache so the new list is used on the next rerun.
+        # Сбрасываем нормализованный кэш, чтобы новый список использовался при следующем перезапуске.
+        load_excluded_articles_normalized.clear()
         return True
     except Exception as e:
         st.error(f"Błąd zapisywania excluded_articles.json: {e}")
@@ -136,3 +156,22 @@ def classify_pallet(
 
     # 2. Default to Other.
     return "Inne opakowania"
+
+# --- DATE HELPERS (shared by filters and tabs) ---
+
+def date_range_mask(dates, date_start, date_end):
+    # Inclusive [date_start, date_end] mask over a datetime64 column, compared as int64 nanoseconds.
+    # Включающая маска [date_start, date_end] по колонке datetime64, сравнение как int64 наносекунд.
+    # NaT is the minimum int64, so missing dates never fall inside the range.
+    # NaT - минимальное значение int64, поэтому пустые даты никогда не попадают в диапазон.
+    ns = dates.to_numpy(dtype="datetime64[ns]").view("i8")
+    start_ns = pd.Timestamp(date_start).value
+    end_ns = pd.Timestamp(date_end).value
+    return (ns >= start_ns) & (ns <= end_ns)
+
+def date_columns_config(*cols):
+    # Column config that shows datetime64 columns as plain dates (YYYY-MM-DD).
+    # Конфигурация колонок, отображающая колонки datetime64 как обычные даты (YYYY-MM-DD).
+    # Lets st.dataframe format dates itself instead of converting each cell with .dt.date.
+    # Позволяет st.dataframe самому форматировать даты вместо конвертации каждой ячейки через .dt.date.
+    return {c: st.column_config.DateColumn(c, format="YYYY-MM-DD") for c in cols}